@@ -0,0 +1,558 @@
+import time
+import queue
+import heapq
+import struct
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pygame
+
+from dtx_parser import base36_to_int
+
+
+class VoiceManager:
+    """
+    Polyphony and choke handling for sound-effect voices. Used by the
+    player directly, or inside the audio process when that owns the mixer.
+    """
+
+    def __init__(self, choke_map, polyphony_limit, fade_in_ms, fade_out_ms):
+        """
+        Args:
+            choke_map (dict): Maps a choking channel to the channels it stops.
+            polyphony_limit (int): Instances of one channel that may overlap.
+            fade_in_ms (int): Attack applied to every voice.
+            fade_out_ms (int): Release used when a voice is choked or stolen.
+        """
+        self.choke_map = choke_map
+        self.polyphony_limit = polyphony_limit
+        self.fade_in_ms = fade_in_ms
+        self.fade_out_ms = fade_out_ms
+
+        # For polyphony: Stores active channels for each instrument lane.
+        # Structure: { channel_id: [ (channel_object, play_time_ms), ... ] }
+        self.active_poly_sounds = {}
+
+        # For choke logic: Stores the active channel for chokeable sounds.
+        # Structure: { channel_id: channel_object }
+        self.active_choke_sounds = {}
+        # Pre-calculate which channels can BE choked for faster lookups.
+        self.chokeable_channels = {
+            choked for choked_list in choke_map.values() for choked in choked_list
+        }
+
+    def play(self, channel_id, sound, volume, time_ms):
+        """
+        Starts a voice, choking and stealing older voices as needed.
+
+        Args:
+            channel_id (str): The chip channel, e.g. "11".
+            sound (pygame.mixer.Sound): The sample.
+            volume (float): Final volume (0.0-1.0).
+            time_ms (float): Current time; decides which voice is oldest.
+        """
+        # 1. --- Choke Logic ---
+        # If this note is a "choker", stop any corresponding "choked" sounds.
+        for choked_channel_id in self.choke_map.get(channel_id, ()):
+            channel_to_stop = self.active_choke_sounds.pop(choked_channel_id, None)
+            if channel_to_stop and channel_to_stop.get_busy():
+                channel_to_stop.fadeout(self.fade_out_ms)
+
+        # 2. --- Polyphony & Playback Logic ---
+        # Drop instances of this channel that have finished playing naturally.
+        playing_instances = [
+            item for item in self.active_poly_sounds.get(channel_id, []) if item[0].get_busy()
+        ]
+
+        # Voice stealing: If we're at the polyphony limit, stop the oldest sound.
+        if len(playing_instances) >= self.polyphony_limit:
+            playing_instances.sort(key=lambda x: x[1])
+            oldest_channel, _ = playing_instances.pop(0)
+            oldest_channel.fadeout(self.fade_out_ms)
+
+        # Set the volume on the Sound object itself right before playing.
+        # This ensures the fade-in targets the correct final volume.
+        sound.set_volume(volume)
+        new_channel = sound.play(fade_ms=self.fade_in_ms)
+
+        if new_channel:
+            playing_instances.append((new_channel, time_ms))
+            # If this sound is one that can BE choked (e.g., an open hi-hat),
+            # track its channel so a future "choker" can stop it.
+            if channel_id in self.chokeable_channels:
+                self.active_choke_sounds[channel_id] = new_channel
+
+        self.active_poly_sounds[channel_id] = playing_instances
+
+    def stop_all(self):
+        """Stops every sound-effect voice immediately."""
+        pygame.mixer.stop()
+        self.active_poly_sounds.clear()
+        self.active_choke_sounds.clear()
+
+    def active_count(self):
+        """Number of tracked voices that are still sounding."""
+        return sum(
+            1
+            for instances in self.active_poly_sounds.values()
+            for channel, _ in instances
+            if channel.get_busy()
+        )
+
+
+# --- Shared memory layout ---
+# One block of shared memory holds the command ring (game -> audio process)
+# followed by the status block (audio process -> game).
+#
+# Ring: two uint64 counters (records written, records read), then CAPACITY
+# fixed-size records. There is exactly one writer and one reader, and each
+# side only ever stores its own counter (an aligned 8-byte store), so no lock
+# is needed. The counters only grow; a record's slot is its count % CAPACITY.
+RING_COUNTERS = struct.Struct("<QQ")
+# Record: opcode, chip channel (base 36), sample index, two float arguments.
+COMMAND = struct.Struct("<BxHidd")
+
+OP_TRIGGER = 1  # Play sample at perf_counter time a, volume b
+OP_STOP_ALL = 2  # Stop every voice and drop scheduled triggers
+OP_CANCEL_SCHEDULED = 3  # Drop triggers that have not fired yet
+OP_MUSIC_PLAY = 4  # Start the loaded music at a seconds, fading in over b ms
+OP_MUSIC_FADEOUT = 5  # Fade the music out over b ms
+OP_MUSIC_VOLUME = 6  # Set music volume to b
+
+# Status: a sequence counter (odd while the audio process is writing it),
+# then the fields below. Readers retry until they see the same even value
+# before and after copying the fields.
+STATUS_SEQUENCE = struct.Struct("<Q")
+STATUS = struct.Struct("<ddIIIQQd")
+STATUS_FIELDS = (
+    "stamp_s",  # perf_counter time the status was taken at
+    "music_pos_ms",  # pygame.mixer.music.get_pos() at that time
+    "music_busy",
+    "voices",  # Sound-effect voices playing
+    "scheduled",  # Triggers waiting for their time
+    "commands_done",  # Ring records processed so far
+    "triggers_fired",
+    "late_max_ms",  # Worst trigger lateness over the last LATENESS_WINDOW_S
+)
+
+
+class CommandRing:
+    """Single-producer, single-consumer ring of COMMAND records in shared memory."""
+
+    def __init__(self, buffer, capacity):
+        self.capacity = capacity
+        self.counters = buffer[: RING_COUNTERS.size].cast("Q")
+        self.records = buffer[RING_COUNTERS.size : RING_COUNTERS.size + capacity * COMMAND.size]
+
+    @staticmethod
+    def size(capacity):
+        return RING_COUNTERS.size + capacity * COMMAND.size
+
+    def push(self, opcode, channel=0, sample=0, a=0.0, b=0.0):
+        """
+        Writer side. Returns the record's sequence number, or None if the
+        ring is full.
+        """
+        written = self.counters[0]
+        if written - self.counters[1] >= self.capacity:
+            return None
+        COMMAND.pack_into(
+            self.records, (written % self.capacity) * COMMAND.size, opcode, channel, sample, a, b
+        )
+        self.counters[0] = written + 1  # Publish only after the record is complete
+        return written + 1
+
+    def pop_all(self):
+        """Reader side: returns every pending record as a tuple."""
+        read = self.counters[1]
+        written = self.counters[0]
+        commands = [
+            COMMAND.unpack_from(self.records, (i % self.capacity) * COMMAND.size)
+            for i in range(read, written)
+        ]
+        self.counters[1] = written
+        return commands
+
+
+class StatusBlock:
+    """Playback status written by the audio process, read by the game."""
+
+    # A write takes microseconds; a sequence still odd after this many tries
+    # means the audio process died or stalled in the middle of one
+    READ_ATTEMPTS = 1000
+
+    def __init__(self, buffer):
+        self.sequence = buffer[: STATUS_SEQUENCE.size].cast("Q")
+        self.fields = buffer[STATUS_SEQUENCE.size : STATUS_SEQUENCE.size + STATUS.size]
+        self.last = dict.fromkeys(STATUS_FIELDS, 0)  # Last consistent status read
+        self.stalled = False  # Warned that no consistent status could be read
+
+    @staticmethod
+    def size():
+        return STATUS_SEQUENCE.size + STATUS.size
+
+    def write(self, *values):
+        self.sequence[0] += 1
+        STATUS.pack_into(self.fields, 0, *values)
+        self.sequence[0] += 1
+
+    def read(self):
+        """
+        Returns the latest consistent status as a dict, or the last one read
+        if no consistent status turns up within READ_ATTEMPTS tries.
+        """
+        # Once stalled, don't wait again on every read; one try is enough to notice a recovery
+        for _ in range(1 if self.stalled else self.READ_ATTEMPTS):
+            before = self.sequence[0]
+            if before % 2 == 0:
+                values = STATUS.unpack_from(self.fields, 0)
+                if self.sequence[0] == before:
+                    self.last = dict(zip(STATUS_FIELDS, values))
+                    self.stalled = False
+                    return self.last
+            time.sleep(0)
+        if not self.stalled:
+            print("Warning: The audio process stopped updating its status; using the last one.")
+            self.stalled = True
+        return self.last
+
+
+def _channel_name(code):
+    """Inverse of base36_to_int for two-character chip channels."""
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return digits[code // 36] + digits[code % 36]
+
+
+def _engine_main(conn, buffer, capacity, init_audio, decode_workers):
+    """
+    Entry point of the audio process. Owns the mixer, the decoded samples
+    and all voice state; everything else arrives as commands.
+    """
+    init_audio()
+    shared = memoryview(buffer).cast("B")
+    ring = CommandRing(shared, capacity)
+    status = StatusBlock(shared[CommandRing.size(capacity) :])
+    music = pygame.mixer.music
+
+    sounds = []  # Sample index -> Sound
+    sample_indices = {}  # Sample path -> index
+    voices = None  # VoiceManager, created by the 'configure_voices' request
+    scheduled = []  # Heap of (due_s, order, channel, sample, volume)
+    order = 0
+    triggers_fired = 0
+    commands_done = 0
+    late_max_ms = 0.0
+    late_window_start_s = time.perf_counter()
+
+    # Decodes and stem renders run on worker threads; results come back here
+    # so only this thread touches `sounds` and the pipe.
+    workers = ThreadPoolExecutor(max_workers=decode_workers)
+    finished = queue.SimpleQueue()
+
+    def run_in_worker(request_id, function, *args):
+        def done(future):
+            finished.put((request_id, future))
+
+        workers.submit(function, *args).add_done_callback(done)
+
+    def render_stems(charts):
+        from autoplay_stem import render_stems
+
+        sound_cache = {path: sounds[i] for path, i in sample_indices.items()}
+        return render_stems(charts, sound_cache, decode_workers=decode_workers)
+
+    conn.send((None, True, "ready"))
+    running = True
+    while running:
+        # --- Requests over the control pipe (anything that isn't real-time) ---
+        while conn.poll():
+            request_id, kind, args = conn.recv()
+            try:
+                if kind == "load_sample":
+                    (path,) = args
+                    if path in sample_indices:
+                        conn.send((request_id, True, sample_indices[path]))
+                    else:
+                        run_in_worker(request_id, lambda p: (p, pygame.mixer.Sound(p)), path)
+                elif kind == "render_stems":
+                    run_in_worker(request_id, render_stems, *args)
+                elif kind == "music_load":
+                    music.load(*args)
+                    conn.send((request_id, True, None))
+                elif kind == "configure_voices":
+                    voices = VoiceManager(*args)
+                    conn.send((request_id, True, None))
+                elif kind == "sample_lengths":
+                    conn.send((request_id, True, [sound.get_length() for sound in sounds]))
+                elif kind == "set_num_channels":
+                    pygame.mixer.set_num_channels(*args)
+                    conn.send((request_id, True, None))
+                elif kind == "shutdown":
+                    running = False
+                    conn.send((request_id, True, None))
+            except Exception as e:
+                conn.send((request_id, False, e))
+
+        while not finished.empty():
+            request_id, future = finished.get()
+            error = future.exception()
+            if error is not None:
+                conn.send((request_id, False, error))
+                continue
+            result = future.result()
+            if isinstance(result, tuple):  # A decoded sample: (path, Sound)
+                path, sound = result
+                if path not in sample_indices:
+                    sample_indices[path] = len(sounds)
+                    sounds.append(sound)
+                result = sample_indices[path]
+            conn.send((request_id, True, result))
+
+        # --- Real-time commands from the ring ---
+        for opcode, channel, sample, a, b in ring.pop_all():
+            commands_done += 1
+            if opcode == OP_TRIGGER:
+                heapq.heappush(scheduled, (a, order, channel, sample, b))
+                order += 1
+            elif opcode == OP_STOP_ALL:
+                scheduled.clear()
+                if voices:
+                    voices.stop_all()
+            elif opcode == OP_CANCEL_SCHEDULED:
+                scheduled.clear()
+            elif opcode == OP_MUSIC_PLAY:
+                music.play(start=a, fade_ms=int(b))
+            elif opcode == OP_MUSIC_FADEOUT:
+                music.fadeout(int(b))
+            elif opcode == OP_MUSIC_VOLUME:
+                music.set_volume(b)
+
+        # --- Fire triggers that are due ---
+        now_s = time.perf_counter()
+        if now_s - late_window_start_s > AudioEngine.LATENESS_WINDOW_S:
+            late_window_start_s = now_s
+            late_max_ms = 0.0
+        while scheduled and scheduled[0][0] <= now_s:
+            due_s, _, channel, sample, volume = heapq.heappop(scheduled)
+            if voices and sample < len(sounds):
+                voices.play(_channel_name(channel), sounds[sample], volume, now_s * 1000)
+                triggers_fired += 1
+                late_max_ms = max(late_max_ms, (now_s - due_s) * 1000)
+
+        status.write(
+            time.perf_counter(),
+            music.get_pos(),
+            music.get_busy(),
+            voices.active_count() if voices else 0,
+            len(scheduled),
+            commands_done,
+            triggers_fired,
+            late_max_ms,
+        )
+
+        # Sleep until the next trigger, but keep polling for commands
+        wait_s = AudioEngine.POLL_INTERVAL_S
+        if scheduled:
+            wait_s = min(wait_s, scheduled[0][0] - time.perf_counter())
+        if wait_s > 0:
+            time.sleep(wait_s)
+
+    workers.shutdown(cancel_futures=True)
+    pygame.mixer.quit()
+
+
+class MusicProxy:
+    """
+    Stands in for pygame.mixer.music in the game process. Commands go to the
+    audio process; position and busy state come back from its status block.
+    Until the audio process has picked up a play() command, the proxy
+    reports the state that command will produce, so the game clock does not
+    stall in between.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._play_sequence = 0  # Ring sequence number of the last play()
+        self._play_time_s = 0.0
+
+    def load(self, path):
+        """Loads a music file in the audio process. Raises pygame.error on failure."""
+        self.engine._request("music_load", path).result()
+
+    def play(self, start=0.0, fade_ms=0):
+        self._play_time_s = time.perf_counter()
+        self._play_sequence = self.engine._push(OP_MUSIC_PLAY, a=start, b=fade_ms)
+
+    def fadeout(self, time_ms):
+        self.engine._push(OP_MUSIC_FADEOUT, b=time_ms)
+
+    def set_volume(self, volume):
+        self.engine._push(OP_MUSIC_VOLUME, b=volume)
+
+    def _pending_play(self, status):
+        return status["commands_done"] < self._play_sequence
+
+    def get_busy(self):
+        status = self.engine.status.read()
+        return self._pending_play(status) or bool(status["music_busy"])
+
+    def get_pos(self):
+        """Milliseconds since play(), extrapolated from the last status."""
+        now_s = time.perf_counter()
+        status = self.engine.status.read()
+        if self._pending_play(status):
+            return (now_s - self._play_time_s) * 1000
+        if not status["music_busy"]:
+            return status["music_pos_ms"]
+        return status["music_pos_ms"] + (now_s - status["stamp_s"]) * 1000
+
+
+class AudioEngine:
+    """
+    Runs the mixer in its own process, so Python work in the game loop
+    (drawing, fonts, event handling) cannot delay audio.
+
+    The game sends time-stamped commands through a lock-free ring buffer in
+    shared memory: sample triggers carry the perf_counter time they are due
+    at and are fired by the audio process on its own clock. Playback
+    position and voice statistics come back through a status block in the
+    same shared memory. Requests that are not real-time (decoding samples,
+    loading music, rendering stems) go over a pipe and return Futures.
+    """
+
+    RING_CAPACITY = 4096  # Commands in flight; far more than one frame sends
+    POLL_INTERVAL_S = 0.001  # Longest the audio process sleeps between command checks
+    LATENESS_WINDOW_S = 1.0  # Window for the reported worst trigger lateness
+
+    def __init__(self, init_audio, decode_workers=4):
+        """
+        Starts the audio process.
+
+        Args:
+            init_audio (callable): Opens the audio device; run in the audio
+                process (see Player.init_audio).
+            decode_workers (int): Threads the audio process decodes samples with.
+        """
+        # Spawn rather than fork: the game process may already have SDL running.
+        context = multiprocessing.get_context("spawn")
+        size = CommandRing.size(self.RING_CAPACITY) + StatusBlock.size()
+        self._buffer = context.RawArray("B", size)
+        shared = memoryview(self._buffer).cast("B")
+        self.ring = CommandRing(shared, self.RING_CAPACITY)
+        self.status = StatusBlock(shared[CommandRing.size(self.RING_CAPACITY) :])
+        self.music = MusicProxy(self)
+        self.dropped_commands = 0
+
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_engine_main,
+            args=(child_conn, self._buffer, self.RING_CAPACITY, init_audio, decode_workers),
+            name="audio-engine",
+            daemon=True,
+        )
+        self.process.start()
+
+        # Replies are matched to Futures by a listener thread
+        self.ready = Future()
+        self._pending = {}
+        self._next_request_id = 0
+        self._lock = threading.Lock()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                request_id, ok, result = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            if request_id is None:
+                self.ready.set_result(result)
+                continue
+            with self._lock:
+                future = self._pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+        # The audio process is gone; fail whatever is still waiting
+        if not self.ready.done():
+            self.ready.set_exception(RuntimeError("The audio process exited."))
+        with self._lock:
+            for future in self._pending.values():
+                future.set_exception(RuntimeError("The audio process exited."))
+            self._pending.clear()
+
+    def _request(self, kind, *args):
+        future = Future()
+        with self._lock:
+            request_id = self._next_request_id
+            self._next_request_id += 1
+            self._pending[request_id] = future
+            self._conn.send((request_id, kind, args))
+        return future
+
+    def _push(self, opcode, channel=0, sample=0, a=0.0, b=0.0):
+        sequence = self.ring.push(opcode, channel, sample, a, b)
+        if sequence is None:
+            self.dropped_commands += 1
+        return sequence or 0
+
+    # --- Requests (return Futures) ---
+
+    def load_sample(self, path):
+        """Decodes a sample in the audio process. The Future yields its sample index."""
+        return self._request("load_sample", path)
+
+    def render_stems(self, charts):
+        """
+        Renders the autoplay stems of several charts from the audio process'
+        samples, see autoplay_stem.render_stems. The Future yields their paths.
+        """
+        return self._request("render_stems", charts)
+
+    def configure_voices(self, choke_map, polyphony_limit, fade_in_ms, fade_out_ms):
+        """Sets up voice handling in the audio process, see VoiceManager."""
+        return self._request("configure_voices", choke_map, polyphony_limit, fade_in_ms, fade_out_ms)
+
+    def sample_lengths(self):
+        """The Future yields the length in seconds of every sample, by sample index."""
+        return self._request("sample_lengths")
+
+    def set_num_channels(self, count):
+        """Sets the mixer channel count in the audio process."""
+        return self._request("set_num_channels", count)
+
+    # --- Real-time commands ---
+
+    def trigger(self, due_s, channel_id, sample_index, volume):
+        """
+        Schedules a sample to play at perf_counter time `due_s` (immediately
+        if that has passed).
+        """
+        self._push(OP_TRIGGER, base36_to_int(channel_id), sample_index, due_s, volume)
+
+    def cancel_scheduled(self):
+        """Drops triggers that have not fired yet; playing voices continue."""
+        self._push(OP_CANCEL_SCHEDULED)
+
+    def stop_all(self):
+        """Stops all voices and drops triggers that have not fired yet."""
+        self._push(OP_STOP_ALL)
+
+    def stats(self):
+        """Returns the latest status of the audio process, see STATUS_FIELDS."""
+        return self.status.read()
+
+    def shutdown(self):
+        """Stops the audio process."""
+        if self.process.is_alive():
+            try:
+                self._request("shutdown").result(timeout=2)
+            except Exception:
+                pass
+            self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._conn.close()
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import wave
+import platform
+import argparse
+import tempfile
+import threading
+
+import pygame
+
+from cache_files import CACHE_ROOT, temp_path
+
+
+# --- Latency modes ---
+#   auto: the smallest buffer the probe found safe, plus one size of headroom
+#         for spikes a short probe can miss.
+#   low:  the smallest buffer the probe found safe.
+#   safe: the fixed settings the player always used (no probe).
+LATENCY_MODES = ("auto", "low", "safe")
+DEFAULT_LATENCY_MODE = "auto"
+SAFE_SETTINGS = (44100, 1024)  # (sample rate, buffer size in frames)
+
+DEFAULT_PROFILE_PATH = os.path.join(CACHE_ROOT, "audio_profile.json")
+PROFILE_VERSION = 1
+
+# --- Probe ---
+PROBE_FREQUENCIES = (44100, 48000)  # Preferred first: most samples are 44.1 kHz
+PROBE_BUFFER_SIZES = (128, 256, 512, 1024, 2048)
+PROBE_VOICES = 64  # Looping voices mixed during the probe
+PROBE_DURATION_S = 1.0
+UNDERRUN_TOLERANCE_MS = 3.0  # Lost time (ms) still put down to clock granularity
+
+# --- Mixer channels ---
+DEFAULT_MIXER_CHANNELS = 64  # Used until a chart's polyphony is known
+MIN_MIXER_CHANNELS = 16
+CHANNEL_HEADROOM = 8  # Spare channels on top of the chart's peak polyphony
+
+
+def machine_key():
+    """Profiles are kept per machine and audio driver."""
+    return f"{platform.node()}|{os.environ.get('SDL_AUDIODRIVER', 'default')}"
+
+
+def probe_buffer(frequency, buffer_size, voices=PROBE_VOICES, duration_s=PROBE_DURATION_S):
+    """
+    Plays silence through the audio device under a synthetic load and
+    measures how much audio was lost to underruns.
+
+    The music stream supplies the clock: pygame's music position advances
+    by the audio mixed in each callback and is interpolated with the wall
+    clock in between, so wall time minus music position stays constant
+    while callbacks keep up and grows by every gap the device had to fill.
+    Meanwhile `voices` looping sounds keep the mixer busy and a Python
+    thread keeps a core busy, as a game loop would.
+
+    The mixer must not be initialized when this is called.
+
+    Returns:
+        float: Lost time in ms (0 or less means no underrun).
+    """
+    pygame.mixer.init(frequency, -16, 2, buffer_size)
+    pygame.mixer.set_num_channels(voices)
+
+    # Silent audio costs as much to mix as any other, and is inaudible
+    fd, stream_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    with wave.open(stream_path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(frequency)
+        f.writeframes(bytes(int(frequency * (duration_s + 1)) * 4))
+    silence = pygame.mixer.Sound(buffer=bytes(frequency // 2 * 4))
+
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(10000))
+
+    load_thread = threading.Thread(target=busy_loop, daemon=True)
+    try:
+        for i in range(voices):
+            pygame.mixer.Channel(i).play(silence, loops=-1)
+        load_thread.start()
+        pygame.mixer.music.load(stream_path)
+        pygame.mixer.music.play()
+
+        start_s = time.perf_counter()
+        lags_ms = []
+        now_s = start_s
+        while now_s - start_s < duration_s:
+            lags_ms.append((now_s - start_s) * 1000 - pygame.mixer.music.get_pos())
+            time.sleep(0.002)
+            now_s = time.perf_counter()
+    finally:
+        stop.set()
+        if load_thread.is_alive():
+            load_thread.join()
+        pygame.mixer.quit()
+        os.remove(stream_path)
+
+    # Medians of the first and last tenth, so a single late poll doesn't count
+    n = max(1, len(lags_ms) // 10)
+    first = sorted(lags_ms[:n])[n // 2]
+    last = sorted(lags_ms[-n:])[n // 2]
+    return last - first
+
+
+def probe_device(verbose=True):
+    """
+    Finds the smallest buffer that plays without underruns at each probed
+    sample rate, and picks the setting with the smallest buffer.
+
+    Returns:
+        dict: The profile: 'frequency', 'buffer', 'latency_ms' and the
+        per-rate 'results'.
+    """
+    results = {}
+    for frequency in PROBE_FREQUENCIES:
+        smallest = None
+        for buffer_size in PROBE_BUFFER_SIZES:
+            lost_ms = probe_buffer(frequency, buffer_size)
+            if verbose:
+                print(f"  {frequency} Hz, {buffer_size:4d} frames: {max(lost_ms, 0.0):.1f} ms lost")
+            if lost_ms <= UNDERRUN_TOLERANCE_MS:
+                smallest = buffer_size
+                break
+        results[str(frequency)] = smallest
+
+    # Prefer the earlier rate unless a later one needs a smaller buffer
+    frequency, buffer_size = None, None
+    for rate in PROBE_FREQUENCIES:
+        size = results[str(rate)]
+        if size is not None and (buffer_size is None or size < buffer_size):
+            frequency, buffer_size = rate, size
+    if buffer_size is None:
+        frequency, buffer_size = PROBE_FREQUENCIES[0], PROBE_BUFFER_SIZES[-1]
+        print("Warning: Every probed buffer size underran; using the largest.")
+
+    return {
+        "version": PROFILE_VERSION,
+        "frequency": frequency,
+        "buffer": buffer_size,
+        "latency_ms": buffer_size / frequency * 1000,
+        "results": results,
+        "probed_at": time.time(),
+    }
+
+
+def load_profile(path=DEFAULT_PROFILE_PATH):
+    """Returns this machine's saved profile, or None."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            profile = json.load(f).get(machine_key())
+    except (OSError, ValueError, AttributeError):
+        return None
+    if not profile or profile.get("version") != PROFILE_VERSION:
+        return None
+    return profile
+
+
+def save_profile(profile, path=DEFAULT_PROFILE_PATH):
+    """Stores a profile for this machine, keeping other machines' entries."""
+    profiles = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        pass
+    profiles[machine_key()] = profile
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def audio_settings(latency_mode=DEFAULT_LATENCY_MODE, profile_path=DEFAULT_PROFILE_PATH):
+    """
+    Picks the mixer settings for a latency mode, probing the device first
+    if this machine has no saved profile yet. Must be called before the
+    mixer is initialized.
+
+    Returns:
+        tuple: (sample rate, buffer size in frames).
+    """
+    if latency_mode == "safe":
+        return SAFE_SETTINGS
+
+    profile = load_profile(profile_path)
+    if profile is None:
+        print("Probing the audio device for the smallest safe buffer (once per machine)...")
+        profile = probe_device()
+        save_profile(profile, profile_path)
+
+    buffer_size = profile["buffer"]
+    if latency_mode == "auto":
+        # One size up, but no larger than the safe buffer unless the probe needed more
+        larger = [size for size in PROBE_BUFFER_SIZES if size > buffer_size]
+        if larger:
+            buffer_size = max(buffer_size, min(larger[0], SAFE_SETTINGS[1]))
+    return profile["frequency"], buffer_size
+
+
+def peak_polyphony(notes, polyphony_limit, choke_map, fade_out_ms):
+    """
+    Replays a chart's notes through the voice rules of VoiceManager
+    (per-channel polyphony limit, voice stealing and choking, each with a
+    fade-out) and returns the most voices that ever sound at once.
+
+    Args:
+        notes (list[tuple]): Sorted (time_ms, channel_id, sample length in ms).
+        polyphony_limit (int): See VoiceManager.
+        choke_map (dict): See VoiceManager.
+        fade_out_ms (int): Release of stolen and choked voices.
+
+    Returns:
+        int: Peak number of simultaneous voices.
+    """
+    voices = []  # Every voice as [start_ms, end_ms]
+    playing = {}  # Maps channel_id to its voices that were sounding at the last note
+    chokeable = {choked for choked_list in choke_map.values() for choked in choked_list}
+    choke_targets = {}  # Maps a chokeable channel_id to its latest voice
+
+    for time_ms, channel_id, length_ms in notes:
+        for choked in choke_map.get(channel_id, ()):
+            voice = choke_targets.pop(choked, None)
+            if voice:
+                voice[1] = min(voice[1], time_ms + fade_out_ms)
+
+        instances = [v for v in playing.get(channel_id, []) if v[1] > time_ms]
+        if len(instances) >= polyphony_limit:
+            oldest = instances.pop(0)
+            oldest[1] = min(oldest[1], time_ms + fade_out_ms)
+
+        voice = [time_ms, time_ms + length_ms]
+        voices.append(voice)
+        instances.append(voice)
+        playing[channel_id] = instances
+        if channel_id in chokeable:
+            choke_targets[channel_id] = voice
+
+    # Sweep over start/end events; ends sort before starts at equal times
+    events = sorted([(start, 1) for start, _ in voices] + [(end, -1) for _, end in voices])
+    peak = count = 0
+    for _, change in events:
+        count += change
+        peak = max(peak, count)
+    return peak
+
+
+def mixer_channels(peak):
+    """Channel count for a chart with the given peak polyphony."""
+    return max(MIN_MIXER_CHANNELS, peak + CHANNEL_HEADROOM)
+
+
+def main():
+    """Command-line entry point: probe the audio device and save the profile."""
+    parser = argparse.ArgumentParser(
+        description="Probe the audio device for the smallest buffer it plays without underruns."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="print the results without saving them"
+    )
+    args = parser.parse_args()
+
+    print(f"Probing '{machine_key()}' with {PROBE_VOICES} voices under load...")
+    profile = probe_device()
+    print(
+        f"Smallest safe setting: {profile['frequency']} Hz, {profile['buffer']} frames "
+        f"({profile['latency_ms']:.1f} ms)."
+    )
+    if not args.dry_run:
+        save_profile(profile)
+        print(f"Saved to '{DEFAULT_PROFILE_PATH}'.")
+
+
+if __name__ == "__main__":
+    main()
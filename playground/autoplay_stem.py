@@ -0,0 +1,141 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame
+
+from cache_files import CACHE_ROOT, write_wav_atomic
+
+
+# Bump when the rendering changes so stale cached stems are not reused.
+STEM_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(CACHE_ROOT, "stems")
+
+
+def chart_hash(dtx_data, mixer_format):
+    """
+    Hashes everything a chart's autoplay stem depends on: the chart file,
+    the mixer format, and the size and modification time of every sample
+    its autoplay chips use.
+    """
+    digest = hashlib.sha1()
+    digest.update(f"v{STEM_FORMAT_VERSION} {mixer_format}".encode())
+    with open(dtx_data.dtx_path, "rb") as f:
+        digest.update(f.read())
+    for wav_id in sorted({chip[2] for chip in dtx_data.autoplay_chips}):
+        path = dtx_data.wav_files.get(wav_id)
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def render_stem(dtx_data, sound_cache=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Pre-mixes every autoplay chip of a chart (BGM channel 01 and SE channels
+    61-92) into a single WAV file starting at chart time 0.
+
+    Chips are mixed additively at their #VOLUME, so a backing track cut into
+    many chips plays back exactly as charted without needing a mixer channel
+    per chip. Stems are cached in `cache_dir` under the chart hash.
+
+    Args:
+        dtx_data (Dtx): The parsed chart.
+        sound_cache (dict, optional): Already decoded Sounds keyed by file path.
+        cache_dir (str): Directory for rendered stems.
+
+    Returns:
+        str | None: Path to the stem, or None if the chart has no usable
+        autoplay chips.
+    """
+    return render_stems([dtx_data], sound_cache, cache_dir)[0]
+
+
+def render_stems(charts, sound_cache=None, cache_dir=DEFAULT_CACHE_DIR, decode_workers=4):
+    """
+    Renders the stems of several charts, typically the difficulties of a
+    song set (see render_stem). Samples the charts share, above all the
+    BGM, are decoded once for all of them rather than once per chart, and
+    only for charts whose stem is not cached yet.
+
+    Args:
+        charts (list[Dtx]): The parsed charts.
+        sound_cache (dict, optional): Already decoded Sounds keyed by file path.
+        cache_dir (str): Directory for rendered stems.
+        decode_workers (int): Threads decoding samples missing from `sound_cache`.
+
+    Returns:
+        list[str | None]: The stem path of each chart, in order.
+    """
+    frequency, _, channels = pygame.mixer.get_init()
+    stem_paths = [
+        os.path.join(cache_dir, chart_hash(dtx_data, (frequency, channels)) + ".wav")
+        for dtx_data in charts
+    ]
+    to_render = [i for i, path in enumerate(stem_paths) if not os.path.exists(path)]
+    if not to_render:
+        return stem_paths
+
+    # Decode whatever the charts to render need and no chart loaded yet
+    sound_cache = sound_cache or {}
+    sample_paths = set()
+    for i in to_render:
+        for wav_id in {chip[2] for chip in charts[i].autoplay_chips}:
+            path = charts[i].wav_files.get(wav_id)
+            if path and os.path.exists(path):
+                sample_paths.add(path)
+
+    def decode(path):
+        try:
+            return pygame.mixer.Sound(path)
+        except pygame.error as e:
+            print(f"Warning: Could not load '{os.path.basename(path)}' for the stem. Error: {e}")
+            return None
+
+    missing = sorted(p for p in sample_paths if sound_cache.get(p) is None)
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        decoded = dict(zip(missing, pool.map(decode, missing)))
+
+    pcm_by_path = {}  # Sample path -> PCM array scaled to -1.0..1.0, shared by all charts
+    for path in sample_paths:
+        sound = sound_cache.get(path) or decoded.get(path)
+        if sound is None:
+            continue
+        pcm = pygame.sndarray.array(sound)
+        if pcm.ndim == 1:
+            pcm = pcm[:, np.newaxis]
+        full_scale = np.iinfo(pcm.dtype).max if np.issubdtype(pcm.dtype, np.integer) else 1.0
+        pcm_by_path[path] = pcm.astype(np.float32) / np.float32(full_scale)
+    decoded = None  # The PCM arrays are all that is needed from here on
+
+    for i in to_render:
+        if not _mix_stem(charts[i], pcm_by_path, stem_paths[i], frequency, channels):
+            stem_paths[i] = None
+    return stem_paths
+
+
+def _mix_stem(dtx_data, pcm_by_path, stem_path, frequency, channels):
+    """
+    Mixes one chart's autoplay chips and writes the stem.
+
+    Returns:
+        bool: False if the chart has no usable autoplay chips.
+    """
+    chips = []
+    for time_ms, _, wav_id in dtx_data.autoplay_chips:
+        pcm = pcm_by_path.get(dtx_data.wav_files.get(wav_id))
+        if pcm is not None:
+            gain = np.float32(dtx_data.wav_volumes.get(wav_id, 100) / 100.0)
+            chips.append((int(round(time_ms * frequency / 1000.0)), pcm, gain))
+    if not chips:
+        return False
+
+    total_frames = max(start + len(pcm) for start, pcm, _ in chips)
+    mix = np.zeros((total_frames, channels), dtype=np.float32)
+    for start, pcm, gain in chips:
+        mix[start : start + len(pcm)] += pcm * gain
+
+    pcm_out = (np.clip(mix, -1.0, 1.0) * 32767).astype("<i2")
+    write_wav_atomic(stem_path, pcm_out, frequency)
+    return True
@@ -0,0 +1,42 @@
+import os
+import wave
+import threading
+
+
+# Root of the player's caches: processed samples, autoplay stems, decoded
+# previews and the audio device profile each live in their own entry below it.
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "patazon")
+
+
+def temp_path(path):
+    """
+    Returns a name next to `path` that is unique to this process and thread.
+    Files are written there first and then moved into place with os.replace,
+    so concurrent readers and writers never see a partial file.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_wav_atomic(path, pcm, frequency, channels=None):
+    """
+    Writes 16-bit PCM to a WAV file without ever exposing a partial file
+    (see temp_path). Creates the parent directory if needed.
+
+    Args:
+        path (str): Destination WAV file.
+        pcm (numpy.ndarray | bytes): 16-bit little-endian samples, either as
+            a (frames, channels) array or as interleaved raw bytes.
+        frequency (int): Sample rate in Hz.
+        channels (int, optional): Channel count; required for raw bytes.
+    """
+    if channels is None:
+        channels = pcm.shape[1]
+        pcm = pcm.tobytes()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = temp_path(path)
+    with wave.open(tmp_path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(frequency)
+        f.writeframes(pcm)
+    os.replace(tmp_path, path)
@@ -0,0 +1,244 @@
+import os
+import sys
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dtx_parser import Dtx, LANE_DEFINITIONS, CHANNEL_TO_LANE_MAP
+
+
+# Lanes played with the feet; every other lane counts as a hand lane.
+FOOT_CHANNELS = {"13", "1B", "1C"}
+
+# Scalar per-chart statistics, in export column order.
+SCALAR_COLUMNS = [
+    "path",
+    "title",
+    "artist",
+    "duration_s",
+    "total_notes",
+    "avg_nps",
+    "peak_nps",
+    "hand_notes",
+    "foot_notes",
+    "foot_ratio",
+    "bpm_min",
+    "bpm_max",
+    "wavs_defined",
+    "wavs_used",
+    "wavs_missing",
+] + [f"peak_{lane['name']}" for lane in LANE_DEFINITIONS]
+
+
+def find_charts(library_dir):
+    """Recursively collects every .dtx file below `library_dir`."""
+    charts = []
+    for root, _, files in os.walk(library_dir):
+        for name in files:
+            if name.lower().endswith(".dtx"):
+                charts.append(os.path.join(root, name))
+    return sorted(charts)
+
+
+def sliding_window_peak(times_ms, window_ms):
+    """
+    Returns the largest number of events falling inside any window of
+    `window_ms`, anchored at each event.
+
+    Args:
+        times_ms (np.ndarray): Sorted event times in milliseconds.
+        window_ms (float): Window length in milliseconds.
+    """
+    if times_ms.size == 0:
+        return 0
+    window_ends = np.searchsorted(times_ms, times_ms + window_ms, side="left")
+    return int((window_ends - np.arange(times_ms.size)).max())
+
+
+def lane_matrix(times_ms, lanes, bin_ms=1000.0):
+    """
+    Counts notes per lane per time bin.
+
+    Returns:
+        np.ndarray: Array of shape (number of lanes, num_bins).
+    """
+    num_bins = int(times_ms.max() // bin_ms) + 1 if times_ms.size else 0
+    matrix = np.zeros((len(LANE_DEFINITIONS), num_bins), dtype=np.int32)
+    if times_ms.size:
+        np.add.at(matrix, (lanes, (times_ms // bin_ms).astype(np.int64)), 1)
+    return matrix
+
+
+def analyze_chart(dtx_path, window_ms=1000.0):
+    """
+    Parses one chart and computes its statistics.
+
+    Args:
+        dtx_path (str): Path to the .dtx file.
+        window_ms (float): Window used for the notes-per-second curve and
+            the peak density figures (all reported in notes per second).
+
+    Returns:
+        dict: Scalar statistics (see SCALAR_COLUMNS) plus 'nps_curve', an
+        array with the notes per second in each `window_ms` bin.
+    """
+    dtx = Dtx(dtx_path)
+    dtx.parse(verbose=False)
+
+    # Drum lane notes only; other chip channels are not part of the performance.
+    playable = [n for n in dtx.timed_notes if n[1] in CHANNEL_TO_LANE_MAP]
+    times_ms = np.fromiter((n[0] for n in playable), dtype=np.float64, count=len(playable))
+    lanes = np.fromiter(
+        (CHANNEL_TO_LANE_MAP[n[1]] for n in playable),
+        dtype=np.int64,
+        count=len(playable),
+    )
+    is_foot = np.fromiter(
+        (n[1] in FOOT_CHANNELS for n in playable), dtype=bool, count=len(playable)
+    )
+
+    # Densities are counted per `window_ms` and reported in notes per second
+    per_second = 1000.0 / window_ms
+    matrix = lane_matrix(times_ms, lanes, window_ms)
+    nps_curve = matrix.sum(axis=0) * per_second
+
+    duration_s = 0.0
+    if times_ms.size:
+        duration_s = (times_ms[-1] - times_ms[0]) / 1000.0
+
+    bpms = np.array(dtx.bpm_values(), dtype=np.float64)
+
+    used_wavs = {n[2] for n in dtx.timed_notes + dtx.autoplay_chips}
+    if dtx.bgm_wav_id:
+        used_wavs.add(dtx.bgm_wav_id)
+    missing = [w for w, p in dtx.wav_files.items() if not os.path.exists(p)]
+
+    foot_notes = int(is_foot.sum())
+    stats = {
+        "path": dtx_path,
+        "title": dtx.title,
+        "artist": dtx.artist,
+        "duration_s": duration_s,
+        "total_notes": int(times_ms.size),
+        "avg_nps": times_ms.size / duration_s if duration_s > 0 else 0.0,
+        "peak_nps": sliding_window_peak(times_ms, window_ms) * per_second,
+        "hand_notes": int(times_ms.size) - foot_notes,
+        "foot_notes": foot_notes,
+        "foot_ratio": foot_notes / times_ms.size if times_ms.size else 0.0,
+        "bpm_min": float(bpms.min()),
+        "bpm_max": float(bpms.max()),
+        "wavs_defined": len(dtx.wav_files),
+        "wavs_used": len(used_wavs & dtx.wav_files.keys()),
+        "wavs_missing": len(missing),
+        "nps_curve": nps_curve,
+    }
+    for i, lane in enumerate(LANE_DEFINITIONS):
+        stats[f"peak_{lane['name']}"] = (
+            sliding_window_peak(times_ms[lanes == i], window_ms) * per_second
+        )
+    return stats
+
+
+def _analyze_chart_safe(args):
+    """Worker wrapper so one broken chart doesn't abort the whole library."""
+    dtx_path, window_ms = args
+    try:
+        return analyze_chart(dtx_path, window_ms)
+    except Exception as e:
+        print(f"Warning: Could not analyze '{dtx_path}'. Error: {e}")
+        return None
+
+
+def analyze_library(chart_paths, window_ms=1000.0, jobs=None):
+    """
+    Analyzes many charts in parallel across a process pool.
+
+    Args:
+        chart_paths (list[str]): Paths to .dtx files.
+        window_ms (float): See analyze_chart.
+        jobs (int, optional): Worker processes; defaults to the CPU count.
+
+    Returns:
+        list[dict]: Statistics for every chart that could be analyzed, in
+        the order of `chart_paths`.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(
+            _analyze_chart_safe,
+            [(path, window_ms) for path in chart_paths],
+            chunksize=max(1, len(chart_paths) // (4 * (jobs or os.cpu_count() or 1))),
+        )
+        return [r for r in results if r is not None]
+
+
+def export_results(results, output_path, fmt):
+    """
+    Writes the statistics in a columnar format.
+
+    CSV holds the scalar columns only. Parquet adds the notes-per-second
+    curve as a list column. NPZ stores one array per scalar column plus the
+    curves concatenated into 'nps_curve_values' with 'nps_curve_offsets'
+    marking where each chart's curve starts.
+    """
+    if fmt == "csv":
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=SCALAR_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(results)
+    elif fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow).")
+        columns = {col: [r[col] for r in results] for col in SCALAR_COLUMNS}
+        columns["nps_curve"] = [r["nps_curve"].tolist() for r in results]
+        pq.write_table(pa.table(columns), output_path)
+    elif fmt == "npz":
+        columns = {col: np.array([r[col] for r in results]) for col in SCALAR_COLUMNS}
+        curves = [r["nps_curve"] for r in results]
+        columns["nps_curve_offsets"] = np.cumsum([0] + [c.size for c in curves])
+        columns["nps_curve_values"] = (
+            np.concatenate(curves) if curves else np.zeros(0, dtype=np.float64)
+        )
+        np.savez_compressed(output_path, **columns)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def main():
+    """Command-line entry point: analyze a chart library and export a report."""
+    parser = argparse.ArgumentParser(description="Compute statistics for a DTX library.")
+    parser.add_argument("library", help="directory to scan for .dtx files")
+    parser.add_argument("-o", "--output", required=True, help="report file to write")
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["csv", "parquet", "npz"],
+        help="report format (default: from the output file extension)",
+    )
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument(
+        "--window-ms",
+        type=float,
+        default=1000.0,
+        help="density window in milliseconds (default: 1000)",
+    )
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in ("csv", "parquet", "npz"):
+        print(f"Error: Cannot infer report format from '{args.output}'. Use --format.")
+        sys.exit(1)
+
+    charts = find_charts(args.library)
+    print(f"Analyzing {len(charts)} charts...")
+    results = analyze_library(charts, args.window_ms, args.jobs)
+    export_results(results, args.output, fmt)
+    print(f"Wrote statistics for {len(results)} charts to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import bisect
+
+from dtx_parser import LANE_DEFINITIONS, CHANNEL_TO_LANE_MAP
+
+
+# Judgment windows in ms (hit offset either side of the note), tightest
+# first. These are DTXMania's drum defaults; anything outside the last
+# window is not matched to a note at all.
+JUDGMENT_WINDOWS_MS = (
+    ("PERFECT", 34.0),
+    ("GREAT", 67.0),
+    ("GOOD", 84.0),
+    ("POOR", 117.0),
+)
+JUDGMENT_NAMES = [name for name, _ in JUDGMENT_WINDOWS_MS] + ["MISS"]
+
+# Judgments that keep the combo going.
+COMBO_JUDGMENTS = {"PERFECT", "GREAT", "GOOD"}
+
+
+def lane_note_times(timed_notes):
+    """
+    Splits a chart's timed notes into sorted per-lane time lists. Only drum
+    lane chips are judged; everything else is left to autoplay.
+
+    Returns:
+        list[list[float]]: One list of note times (ms) per lane.
+    """
+    lanes = [[] for _ in LANE_DEFINITIONS]
+    for time_ms, channel_id, _ in timed_notes:
+        lane = CHANNEL_TO_LANE_MAP.get(channel_id)
+        if lane is not None:
+            lanes[lane].append(time_ms)
+    return lanes
+
+
+class Judge:
+    """
+    Matches pad hits against a chart's notes and keeps score. This is the
+    single judgment path: the player feeds it live hits and the replayer
+    feeds it recorded ones, so both score identically.
+
+    Notes are consumed in order per lane. A hit is matched to the nearer of
+    the lane's next two unjudged notes; a note that can no longer be hit
+    (older than the widest window) counts as a MISS. Hits that match no
+    note are ignored. All bookkeeping is amortized O(1) per hit, since the
+    replayer runs this for thousands of sessions.
+    """
+
+    def __init__(self, lane_times, windows=JUDGMENT_WINDOWS_MS):
+        """
+        Args:
+            lane_times (list[list[float]]): From lane_note_times().
+            windows (tuple): (name, ms) pairs, tightest first.
+        """
+        self.lane_times = lane_times
+        self.windows = windows
+        self.max_window_ms = windows[-1][1]
+
+        # All notes in time order; lanes refer to them by index
+        notes = sorted((t, lane) for lane, times in enumerate(lane_times) for t in times)
+        self.note_times = [t for t, _ in notes]
+        self.lane_notes = [[] for _ in lane_times]
+        for i, (_, lane) in enumerate(notes):
+            self.lane_notes[lane].append(i)
+        self.judged = bytearray(len(notes))
+        self.next_index = [0] * len(lane_times)  # Next candidate per lane (into lane_notes)
+        self.miss_cursor = 0  # Notes before this one have all been judged or skipped
+
+        self.counts = {name: 0 for name, _ in windows}
+        self.counts["MISS"] = 0
+        self.combo = 0
+        self.max_combo = 0
+        # Running sums of hit offsets (hit - note), for timing statistics
+        self.offset_count = 0
+        self.offset_sum = 0.0
+        self.offset_sum_sq = 0.0
+
+    def _record(self, judgment):
+        self.counts[judgment] += 1
+        if judgment in COMBO_JUDGMENTS:
+            self.combo += 1
+            self.max_combo = max(self.max_combo, self.combo)
+        else:
+            self.combo = 0
+
+    def advance(self, time_ms):
+        """Counts every note that can no longer be hit at `time_ms` as a MISS."""
+        deadline = time_ms - self.max_window_ms
+        times = self.note_times
+        i = self.miss_cursor
+        while i < len(times) and times[i] < deadline:
+            if not self.judged[i]:
+                self.judged[i] = 1
+                self._record("MISS")
+            i += 1
+        self.miss_cursor = i
+
+    def hit(self, time_ms, lane):
+        """
+        Judges a pad hit.
+
+        Returns:
+            str | None: The judgment, or None if no note was in range.
+        """
+        self.advance(time_ms)
+        notes = self.lane_notes[lane]
+        i = self.next_index[lane]
+        while i < len(notes) and self.judged[notes[i]]:
+            i += 1
+        self.next_index[lane] = i
+        if i >= len(notes):
+            return None
+
+        # Prefer the following note if it is closer
+        target = i
+        times = self.note_times
+        if i + 1 < len(notes) and abs(times[notes[i + 1]] - time_ms) < abs(times[notes[i]] - time_ms):
+            target = i + 1
+        offset_ms = time_ms - times[notes[target]]
+        for name, window_ms in self.windows:
+            if abs(offset_ms) <= window_ms:
+                break
+        else:
+            return None
+
+        if target > i:
+            self.judged[notes[i]] = 1
+            self._record("MISS")  # The skipped note can no longer be hit
+        self.judged[notes[target]] = 1
+        self.next_index[lane] = target + 1
+        self._record(name)
+        self.offset_count += 1
+        self.offset_sum += offset_ms
+        self.offset_sum_sq += offset_ms * offset_ms
+        return name
+
+    def seek(self, time_ms):
+        """
+        Jumps to `time_ms`: notes before it that are still unjudged are
+        skipped without scoring, notes after it become hittable again.
+        """
+        start = time_ms - self.max_window_ms
+        self.miss_cursor = bisect.bisect_left(self.note_times, start)
+        self.judged[: self.miss_cursor] = b"\x01" * self.miss_cursor
+        self.judged[self.miss_cursor :] = bytes(len(self.judged) - self.miss_cursor)
+        self.next_index = [bisect.bisect_left(times, start) for times in self.lane_times]
+        self.combo = 0
+
+    def results(self):
+        """
+        Returns:
+            dict: Judgment counts, 'max_combo', and the mean and standard
+            deviation of hit offsets in ms (positive = late).
+        """
+        results = dict(self.counts)
+        results["max_combo"] = self.max_combo
+        mean = self.offset_sum / self.offset_count if self.offset_count else 0.0
+        variance = self.offset_sum_sq / self.offset_count - mean * mean if self.offset_count else 0.0
+        results["mean_offset_ms"] = mean
+        results["stdev_offset_ms"] = max(variance, 0.0) ** 0.5
+        return results
@@ -0,0 +1,823 @@
+import os
+import re
+import bisect
+
+
+def base36_to_int(s):
+    """Converts a base36 string (0-9, A-Z) to an integer."""
+    try:
+        return int(s, 36)
+    except (ValueError, TypeError):
+        return 0
+
+
+# Common encodings for DTX files, with cp932 (Shift-JIS) often being correct.
+DTX_ENCODINGS = ["cp932", "utf-16-le", "utf-8-sig", "utf-8"]
+
+
+def read_command_lines(path, encodings=None):
+    """
+    Reads a DTX-style text file (.dtx, set.def), trying multiple encodings and
+    choosing the one that produces the most valid-looking command lines
+    (starting with '#').
+
+    Args:
+        path (str): The file to read.
+        encodings (list[str], optional): Encodings to try. Defaults to DTX_ENCODINGS.
+
+    Returns:
+        tuple: (lines, encoding, command_line_count). `lines` is None if the
+        file could not be decoded with any of the encodings.
+    """
+    best_content = None
+    best_encoding = None
+    max_command_lines = 0
+
+    for encoding in encodings or DTX_ENCODINGS:
+        try:
+            with open(path, "r", encoding=encoding) as f:
+                lines = f.readlines()
+
+            # Heuristic: The correct encoding should yield many command lines.
+            command_lines = sum(1 for line in lines if line.strip().startswith("#"))
+
+            if command_lines > max_command_lines:
+                max_command_lines = command_lines
+                best_content = lines
+                best_encoding = encoding
+
+        except (UnicodeDecodeError, UnicodeError):
+            continue  # This encoding is incorrect, try the next one.
+        except Exception as e:
+            print(f"An unexpected error occurred while reading with {encoding}: {e}")
+
+    return best_content, best_encoding, max_command_lines
+
+
+class Dtx:
+    """
+    Parses a .dtx file, processes its metadata, and calculates the precise
+    timing of all musical events, including notes and BPM changes.
+    """
+
+    # Channels that do not represent playable notes and should be ignored
+    # when building the list of timed events. This includes visual and
+    # system channels for things like bar lines and BGA control.
+    NON_NOTE_CHANNELS = {
+        # Visual Layers & Control
+        "04", "07", "54", "5A", "C4", "C7",
+        "55", "56", "57", "58", "59", "60",
+        "D5", "D6", "D7", "D8", "D9", "DA", "DB", "DC", "DD", "DE", "DF",
+        # System (Bar lines, visibility toggles, etc.)
+        "50", "51", "C1", "C2",
+    }
+
+    # Autoplay channels: BGM (01) and Sound Effect (SE) chips. These are
+    # timed like notes but are not playable, so they are collected in
+    # autoplay_chips instead of timed_notes.
+    AUTOPLAY_CHANNELS = {
+        "01",
+        "61", "62", "63", "64", "65", "66", "67", "68", "69",
+        "70", "71", "72", "73", "74", "75", "76", "77", "78", "79",
+        "80", "81", "82", "83", "84", "85", "86", "87", "88", "89",
+        "90", "91", "92",
+    }
+
+    # BGA/BGI layer channels, mapped to their drawing order (0 = bottom layer).
+    # These are part of NON_NOTE_CHANNELS too; they never become notes and
+    # are timed separately, see bga_events.
+    BGA_LAYER_CHANNELS = {
+        "04": 0, "07": 1, "55": 2, "56": 3, "57": 4, "58": 5, "59": 6, "60": 7,
+    }
+
+    def __init__(self, dtx_path):
+        """
+        Initializes the Dtx object with the path to the .dtx file.
+
+        Args:
+            dtx_path (str): The full path to the .dtx file.
+
+        Raises:
+            FileNotFoundError: If the .dtx file does not exist.
+        """
+        if not os.path.exists(dtx_path):
+            raise FileNotFoundError(f"DTX file not found: {dtx_path}")
+        self.dtx_path = dtx_path
+        self.directory = os.path.dirname(dtx_path) or "."
+        self.encoding = None  # Encoding detected on the first successful read
+
+        # Metadata with default values
+        self.title = "Untitled"
+        self.artist = "Unknown"
+        self.bpm = 120.0
+
+        # Resource definitions
+        self.wav_files = {}  # Maps WAV ID (str) to its file path
+        self.bpm_changes = {}  # Maps BPM ID (str) to a BPM value (float)
+        self.bar_length_changes = {}  # Maps bar number to a length multiplier (float)
+        self.wav_volumes = {}  # Maps WAV ID to volume (0-100) from #VOLUME
+        self.bgm_wav_id = None
+        self.bgm_start_time_ms = 0.0
+        self.bmp_files = {}  # Maps BMP ID to its image path (#BMPxx)
+        # Maps BGA ID to (bmp_id, x1, y1, x2, y2, dx, dy) from #BGAxx clip definitions
+        self.bga_definitions = {}
+
+        # The final calculated event list
+        self.timed_notes = []  # List of (time_in_ms, wav_id_str)
+        self.autoplay_chips = []  # List of (time_in_ms, channel, wav_id) on AUTOPLAY_CHANNELS
+
+        # --- Source state kept for incremental reloads ---
+        # Definition lines (metadata, WAVs, BPMs, bar lengths), keyed by command.
+        self._definitions = {}
+        # Chip data lines, keyed by '#bbbcc' command. A key may appear on
+        # several lines, so the values are kept in file order.
+        self._bar_lines = {}
+        # File line number of each of those values, keyed like _bar_lines.
+        self._bar_line_numbers = {}
+        # Every chip event, sorted by global beat and then file line once timed.
+        self._raw_events = []
+        self._bar_start_beats = {0: 0.0}
+        # BGA/BGI chip lines, keyed like _bar_lines. Timed only on demand.
+        self._bga_lines = {}
+        self._bga_events = None
+
+    @staticmethod
+    def _split_line(line):
+        """
+        Helper to robustly split a DTX command line into a key and value.
+        Handles commands with and without values.
+        """
+        # Prioritize colon as it's a more definitive separator
+        if ":" in line:
+            key, value = line.split(":", 1)
+            return key, value
+        # Fallback to the first space for commands like '#BPM 120'
+        elif " " in line:
+            key, value = line.split(" ", 1)
+            return key, value
+        # Handle commands with no value, like '#END'
+        return line, ""
+
+    def _read_lines(self, verbose=True):
+        """
+        Reads the DTX file, detecting its encoding on the first read.
+
+        Returns:
+            list[str] | None: The decoded lines, or None if nothing could be read.
+        """
+        # A chart does not change encoding between saves, so on reloads the
+        # previously detected encoding is the only one we need to try.
+        encodings = [self.encoding] if self.encoding else None
+        content, encoding, command_lines = read_command_lines(self.dtx_path, encodings)
+
+        if not content:
+            print("Error: Could not read or decode the file with any supported encodings.")
+            return None
+
+        self.encoding = encoding
+        if verbose:
+            print(
+                f"Successfully read file using encoding '{encoding}' ({command_lines} command lines found)."
+            )
+        return content
+
+    def _collect_lines(self, content):
+        """
+        Splits the decoded file into definition lines and chip data lines.
+
+        Returns:
+            tuple[dict, dict, dict, dict]: (definitions, bar_lines, bga_lines,
+            bar_line_numbers). Definitions map a command key to its value; bar
+            lines and BGA lines map a '#bbbcc' key to the list of its values in
+            file order, and bar_line_numbers to the file line of each value.
+        """
+        definitions = {}
+        bar_lines = {}
+        bga_lines = {}
+        bar_line_numbers = {}
+
+        for line_number, line in enumerate(content):
+            line = line.strip()
+            if not line or not line.startswith("#"):
+                continue
+
+            raw_key, raw_value = self._split_line(line[1:])
+
+            key = raw_key.strip().upper()
+            value = raw_value.strip().split(";")[0].strip()  # Remove comments
+
+            # Check for note/event data lines (e.g., #00108: ...)
+            if len(key) == 5 and re.match(r"^\d{3}[0-9A-Z]{2}$", key):
+                channel = key[3:5]
+
+                # Bar length changes are not standard chip events; they
+                # affect timing like a definition does.
+                if channel == "02":
+                    definitions[key] = value
+                    continue
+
+                if channel in self.BGA_LAYER_CHANNELS:
+                    bga_lines.setdefault(key, []).append(value)
+                    continue
+
+                # Ignore other non-note channels (visual, system, etc.)
+                if channel in self.NON_NOTE_CHANNELS:
+                    continue
+
+                bar_lines.setdefault(key, []).append(value)
+                bar_line_numbers.setdefault(key, []).append(line_number)
+            else:
+                definitions[key] = value
+
+        return definitions, bar_lines, bga_lines, bar_line_numbers
+
+    @staticmethod
+    def _bar_line_order(bar_line_numbers):
+        """Maps each bar to the keys of its chip data lines, in file order."""
+        lines = sorted(
+            (line_number, key)
+            for key, line_numbers in bar_line_numbers.items()
+            for line_number in line_numbers
+        )
+        order = {}
+        for _, key in lines:
+            order.setdefault(int(key[0:3]), []).append(key)
+        return order
+
+    def _apply_definitions(self, definitions):
+        """Rebuilds metadata and resource tables from the definition lines."""
+        self.title = "Untitled"
+        self.artist = "Unknown"
+        self.bpm = 120.0
+        self.wav_files = {}
+        self.bpm_changes = {}
+        self.bar_length_changes = {}
+        self.wav_volumes = {}
+        self.bgm_wav_id = None
+        self.bmp_files = {}
+        self.bga_definitions = {}
+
+        for key, value in definitions.items():
+            if key == "TITLE":
+                self.title = value
+            elif key == "ARTIST":
+                self.artist = value
+            elif key == "BPM" and value:
+                try:
+                    self.bpm = float(value)
+                except ValueError:
+                    print(f"Warning: Invalid BPM value '{value}'")
+            elif key.startswith("WAV") and value:
+                # Normalize path separators to handle DTX files from Windows
+                normalized_value = value.replace("\\", "/")
+                self.wav_files[key[3:]] = os.path.join(self.directory, normalized_value)
+            elif key == "BGMWAV" and value:
+                self.bgm_wav_id = value
+            elif key.startswith("BMP") and len(key) == 5 and value:
+                normalized_value = value.replace("\\", "/")
+                self.bmp_files[key[3:]] = os.path.join(self.directory, normalized_value)
+            elif key.startswith("BGA") and len(key) == 5 and value:
+                # Format: bmp_id x1 y1 x2 y2 dx dy
+                parts = value.split()
+                try:
+                    coords = tuple(int(p) for p in parts[1:7])
+                except ValueError:
+                    coords = ()
+                if len(coords) == 6:
+                    self.bga_definitions[key[3:]] = (parts[0],) + coords
+                else:
+                    print(f"Warning: Invalid BGA definition '{value}' for BGA ID {key[3:]}")
+            elif key.startswith("BPM") and len(key) > 3 and value:
+                try:
+                    self.bpm_changes[key[3:]] = float(value)
+                except ValueError:
+                    print(f"Warning: Invalid BPM change value '{value}'")
+            elif key.startswith("VOLUME") and len(key) > 6 and value:
+                wav_id = key[6:]
+                try:
+                    self.wav_volumes[wav_id] = int(value)
+                except (ValueError, TypeError):
+                    print(
+                        f"Warning: Invalid VOLUME value '{value}' for WAV ID {wav_id}"
+                    )
+            elif len(key) == 5 and key[3:5] == "02" and key[0:3].isdigit():
+                if value:
+                    bar_num = int(key[0:3])
+                    try:
+                        # Bar length is a direct float value in the DTX file
+                        self.bar_length_changes[bar_num] = float(value)
+                    except (ValueError, TypeError):
+                        print(
+                            f"Warning: Invalid bar length value '{value}' for bar {bar_num}"
+                        )
+
+        # If BGMWAV is not specified, default to WAV01, a common convention
+        if not self.bgm_wav_id and "01" in self.wav_files:
+            self.bgm_wav_id = "01"
+
+    def _events_for_key(self, key, values, line_numbers=None):
+        """
+        Expands the chip data lines of one '#bbbcc' key into raw events.
+
+        Args:
+            key (str): The '#bbbcc' key.
+            values (list[str]): Its values in file order.
+            line_numbers (list[int], optional): The file line of each value.
+                Events on the same beat are ordered by it, so the last tempo
+                chip in the file wins whichever way the chart was parsed.
+        """
+        bar_num = int(key[0:3])
+        channel = key[3:5]
+        events = []
+
+        for part, value in enumerate(values):
+            if not value:
+                continue
+
+            notes = [value[i : i + 2] for i in range(0, len(value), 2)]
+            total_notes = len(notes)
+            for i, note_val in enumerate(notes):
+                if note_val != "00":
+                    events.append(
+                        {
+                            "bar": bar_num,
+                            "channel": channel,
+                            "pos": i,
+                            "total_pos": total_notes,
+                            "val": note_val,
+                            "part": part,
+                            "line": line_numbers[part] if line_numbers else part,
+                        }
+                    )
+        return events
+
+    def parse(self, on_resources=None, verbose=True):
+        """
+        Parses the DTX file in two main stages:
+        1. First Pass: Gathers all definitions (metadata, WAVs, BPMs, bar lengths).
+        2. Second Pass: Processes the timeline, calculating the precise time
+           for each event based on the current BPM and bar lengths.
+
+        Args:
+            on_resources (callable, optional): Called with this Dtx between the
+                two passes, once wav_files is known, so sample loading can
+                start while the timeline is still being calculated.
+            verbose (bool): Report progress on stdout. Warnings are always printed.
+        """
+        if verbose:
+            print(f"Parsing '{os.path.basename(self.dtx_path)}'...")
+
+        # --- First Pass: Gather all definitions from the file ---
+        content = self._read_lines(verbose)
+        if content is None:
+            return
+
+        (
+            self._definitions,
+            self._bar_lines,
+            self._bga_lines,
+            self._bar_line_numbers,
+        ) = self._collect_lines(content)
+        self._apply_definitions(self._definitions)
+        if on_resources:
+            on_resources(self)
+
+        self._raw_events = []
+        for key, values in self._bar_lines.items():
+            self._raw_events.extend(
+                self._events_for_key(key, values, self._bar_line_numbers[key])
+            )
+
+        if verbose:
+            print(
+                f"Found {len(self.wav_files)} WAVs, {len(self.bar_length_changes)} bar length changes, and {len(self._raw_events)} raw events."
+            )
+
+        # --- Second Pass: Calculate event timings ---
+        self._retime_from_bar(0)
+        if verbose:
+            print(f"Successfully parsed {len(self.timed_notes)} timed notes.")
+
+    def reload(self):
+        """
+        Re-reads the DTX file after an edit and updates the timeline in place.
+
+        Only the '#bbbcc' keys and definitions whose text changed are
+        re-parsed, and only events from the earliest affected bar onwards are
+        re-timed; everything before that bar keeps its tempo state.
+
+        Returns:
+            dict | None: None if the file is unreadable or nothing changed.
+            Otherwise a summary with 'earliest_bar' (int or None when only
+            resources changed) and 'wav_ids' (set of WAV IDs that are new or
+            point to a different file and so need loading).
+        """
+        content = self._read_lines(verbose=False)
+        if content is None:
+            return None
+
+        definitions, bar_lines, bga_lines, bar_line_numbers = self._collect_lines(content)
+        changed_definitions = {
+            key
+            for key in self._definitions.keys() | definitions.keys()
+            if self._definitions.get(key) != definitions.get(key)
+        }
+        changed_bar_keys = {
+            key
+            for key in self._bar_lines.keys() | bar_lines.keys()
+            if self._bar_lines.get(key) != bar_lines.get(key)
+        }
+        bga_changed = bga_lines != self._bga_lines
+        # Lines moved within a bar change the order of chips on the same beat
+        old_line_order = self._bar_line_order(self._bar_line_numbers)
+        new_line_order = self._bar_line_order(bar_line_numbers)
+        reordered_bars = {
+            bar
+            for bar in old_line_order.keys() | new_line_order.keys()
+            if old_line_order.get(bar) != new_line_order.get(bar)
+        }
+        if (
+            not changed_definitions
+            and not changed_bar_keys
+            and not bga_changed
+            and not reordered_bars
+        ):
+            return None
+
+        # BGA events are rebuilt lazily on next access
+        self._bga_lines = bga_lines
+        self._bga_events = None
+
+        old_wav_files = self.wav_files
+        old_bpm_changes = self.bpm_changes
+        self._definitions = definitions
+        self._apply_definitions(definitions)
+
+        # Work out the earliest bar whose timing can be affected.
+        affected_bars = [int(key[0:3]) for key in changed_bar_keys]
+        affected_bars.extend(reordered_bars)
+        changed_bpm_ids = {
+            bpm_id
+            for bpm_id in old_bpm_changes.keys() | self.bpm_changes.keys()
+            if old_bpm_changes.get(bpm_id) != self.bpm_changes.get(bpm_id)
+        }
+        for key in changed_definitions:
+            if key == "BPM":
+                affected_bars.append(0)
+            elif len(key) == 5 and key[3:5] == "02" and key[0:3].isdigit():
+                affected_bars.append(int(key[0:3]))
+        if changed_bpm_ids:
+            affected_bars.extend(
+                event["bar"]
+                for event in self._raw_events
+                if event["channel"] == "08" and event["val"] in changed_bpm_ids
+            )
+
+        # Swap the events of every changed '#bbbcc' key for freshly parsed ones.
+        if changed_bar_keys:
+            self._raw_events = [
+                event
+                for event in self._raw_events
+                if f"{event['bar']:03d}{event['channel']}" not in changed_bar_keys
+            ]
+            for key in changed_bar_keys:
+                if key in bar_lines:
+                    self._raw_events.extend(
+                        self._events_for_key(key, bar_lines[key], bar_line_numbers[key])
+                    )
+        # Kept events may have moved in the file; give them their new lines
+        for event in self._raw_events:
+            key = f"{event['bar']:03d}{event['channel']}"
+            event["line"] = bar_line_numbers[key][event["part"]]
+        self._bar_lines = bar_lines
+        self._bar_line_numbers = bar_line_numbers
+
+        # A BPM definition may now be used by a newly added chip.
+        if changed_bpm_ids:
+            affected_bars.extend(
+                event["bar"]
+                for event in self._raw_events
+                if event["channel"] == "08" and event["val"] in changed_bpm_ids
+            )
+
+        earliest_bar = min(affected_bars) if affected_bars else None
+        if earliest_bar is not None:
+            self._retime_from_bar(earliest_bar)
+
+        wav_ids = {
+            wav_id
+            for wav_id, path in self.wav_files.items()
+            if old_wav_files.get(wav_id) != path
+        }
+        return {"earliest_bar": earliest_bar, "wav_ids": wav_ids}
+
+    def _retime_from_bar(self, start_bar):
+        """
+        Calculates event timings from the start of `start_bar` onwards.
+
+        Events in earlier bars are assumed to be already timed, and the tempo
+        state (time, BPM) is resumed from the last of them.
+        """
+        raw_events = self._raw_events
+
+        # Pre-calculate the starting beat of each bar to handle time signature changes
+        max_bar = 0
+        if raw_events:
+            max_bar = max(e["bar"] for e in raw_events)
+
+        bar_start_beats = {0: 0.0}
+        for i in range(max_bar + 1):
+            bar_length_multiplier = self.bar_length_changes.get(i, 1.0)
+            beats_in_bar = 4.0 * bar_length_multiplier
+            bar_start_beats[i + 1] = bar_start_beats[i] + beats_in_bar
+
+        # Annotate each event with its precise global beat number
+        for event in raw_events:
+            bar_num = event["bar"]
+            if bar_num < start_bar:
+                continue
+            # Get the length of the specific bar the event is in
+            bar_len_multiplier = self.bar_length_changes.get(bar_num, 1.0)
+            beats_in_this_bar = 4.0 * bar_len_multiplier
+
+            # Position within the bar (0.0 to 1.0) * beats in this bar
+            event_beat_in_bar = (event["pos"] / event["total_pos"]) * beats_in_this_bar
+
+            # Global beat is the sum of beats before this bar + beat pos in this bar
+            event["global_beat"] = bar_start_beats[bar_num] + event_beat_in_bar
+
+        # Sort events by their calculated global beat to process them chronologically;
+        # events on the same beat keep their file order, however they were parsed
+        raw_events.sort(key=lambda x: (x["global_beat"], x["line"]))
+        self._bar_start_beats = bar_start_beats
+        self._bga_events = None  # The tempo map changed; re-time BGA on demand
+
+        # Resume from the tempo state left by the last event before start_bar.
+        start_beat = bar_start_beats.get(start_bar, bar_start_beats[max_bar + 1])
+        first_index = bisect.bisect_left(
+            raw_events, start_beat, key=lambda x: x["global_beat"]
+        )
+        if first_index > 0:
+            previous = raw_events[first_index - 1]
+            current_time_s = previous["time_s"]
+            current_bpm = previous["bpm"]
+            last_event_beat = previous["global_beat"]
+        else:
+            current_time_s = 0.0
+            current_bpm = self.bpm
+            last_event_beat = 0.0
+
+        for event in raw_events[first_index:]:
+            # Calculate time elapsed since the last event using the current BPM
+            delta_beats = event["global_beat"] - last_event_beat
+            delta_time_s = delta_beats * (60.0 / current_bpm)
+            event_time_s = current_time_s + delta_time_s
+
+            # Process the event based on its channel to see if it's a BPM change
+            channel, value = event["channel"], event["val"]
+
+            if channel == "03":  # Direct BPM change (hexadecimal value)
+                try:
+                    current_bpm = float(int(value, 16))
+                except (ValueError, TypeError):
+                    print(f"Warning: Invalid direct BPM value '{value}'")
+            elif channel == "08":  # BPM change from predefined list
+                if value in self.bpm_changes:
+                    current_bpm = self.bpm_changes[value]
+
+            # Remember the tempo state after this event so later reloads can resume here
+            event["time_s"] = event_time_s
+            event["bpm"] = current_bpm
+
+            # Update state for the next iteration
+            current_time_s = event_time_s
+            last_event_beat = event["global_beat"]
+
+        # Rebuild the note lists from the (partially) re-timed events.
+        self.timed_notes = []
+        self.autoplay_chips = []
+        self.bgm_start_time_ms = 0.0
+        first_bgm_event_processed = False
+        for event in raw_events:
+            channel = event["channel"]
+            if channel == "01" and not first_bgm_event_processed:  # BGM event
+                self.bgm_start_time_ms = event["time_s"] * 1000
+                first_bgm_event_processed = True
+            if channel in self.AUTOPLAY_CHANNELS:
+                # Autoplay chips aren't notes, so we keep them apart.
+                self.autoplay_chips.append((event["time_s"] * 1000, channel, event["val"]))
+            elif channel not in ("03", "08"):  # Any other channel is a note.
+                self.timed_notes.append((event["time_s"] * 1000, channel, event["val"]))
+
+        self.timed_notes.sort()
+        self.autoplay_chips.sort()
+
+    def bpm_values(self):
+        """
+        Returns every tempo the chart plays at: the initial #BPM followed by
+        the tempo in effect at each timed event, in time order.
+        """
+        return [self.bpm] + [event["bpm"] for event in self._raw_events if "bpm" in event]
+
+    def _bar_start_beat(self, bar_num):
+        """Returns the global beat at which a bar starts, past the last chip too."""
+        if bar_num in self._bar_start_beats:
+            return self._bar_start_beats[bar_num]
+        last_bar = max(self._bar_start_beats)
+        beat = self._bar_start_beats[last_bar]
+        for i in range(last_bar, bar_num):
+            beat += 4.0 * self.bar_length_changes.get(i, 1.0)
+        return beat
+
+    def _beat_to_time_ms(self, beat):
+        """Converts a global beat to chart time using the timed events' tempo state."""
+        events = self._raw_events
+        i = bisect.bisect_right(events, beat, key=lambda x: x["global_beat"])
+        if i == 0:
+            return beat * (60.0 / self.bpm) * 1000
+        previous = events[i - 1]
+        delta_time_s = (beat - previous["global_beat"]) * (60.0 / previous["bpm"])
+        return (previous["time_s"] + delta_time_s) * 1000
+
+    @property
+    def bga_events(self):
+        """
+        The BGA/BGI timeline as a sorted list of (time_in_ms, layer, id), where
+        id refers to #BMPxx or #BGAxx. Built on first access, since charts are
+        often parsed only for their notes.
+        """
+        if self._bga_events is None:
+            events = []
+            for key, values in self._bga_lines.items():
+                layer = self.BGA_LAYER_CHANNELS[key[3:5]]
+                bar_start = self._bar_start_beat(int(key[0:3]))
+                beats_in_bar = 4.0 * self.bar_length_changes.get(int(key[0:3]), 1.0)
+                for event in self._events_for_key(key, values):
+                    beat = bar_start + (event["pos"] / event["total_pos"]) * beats_in_bar
+                    events.append((self._beat_to_time_ms(beat), layer, event["val"]))
+            events.sort()
+            self._bga_events = events
+        return self._bga_events
+
+
+class SongSet:
+    """
+    Parses a song folder's set.def and every difficulty chart it lists.
+
+    The difficulties of one song normally reference the same samples and
+    BGM, so the set exposes the union of their sample files to let a
+    Player decode each file once and switch charts without reloading.
+    """
+
+    def __init__(self, set_def_path):
+        """
+        Initializes the SongSet with the path to a set.def file.
+
+        Args:
+            set_def_path (str): The full path to the set.def file.
+
+        Raises:
+            FileNotFoundError: If the set.def file does not exist.
+        """
+        if not os.path.exists(set_def_path):
+            raise FileNotFoundError(f"set.def not found: {set_def_path}")
+        self.set_def_path = set_def_path
+        self.directory = os.path.dirname(set_def_path) or "."
+
+        self.title = "Untitled"
+        self.difficulties = []  # List of (label, Dtx), in set.def level order
+
+    @staticmethod
+    def find_set_def(directory):
+        """Returns the path of the set.def in `directory` (any case), or None."""
+        for name in os.listdir(directory):
+            if name.lower() == "set.def":
+                return os.path.join(directory, name)
+        return None
+
+    def parse(self):
+        """
+        Reads the #TITLE and #LnLABEL/#LnFILE entries, then parses all listed
+        charts. Charts that are missing or yield no notes are skipped with a
+        warning.
+        """
+        print(f"Reading song set '{self.set_def_path}'...")
+        content, _, _ = read_command_lines(self.set_def_path)
+        if not content:
+            print("Error: Could not read or decode the set.def file.")
+            return
+
+        labels = {}
+        files = {}
+        for line in content:
+            line = line.strip()
+            if not line.startswith("#"):
+                continue
+            raw_key, raw_value = Dtx._split_line(line[1:])
+            key = raw_key.strip().upper()
+            value = raw_value.strip().split(";")[0].strip()
+
+            if key == "TITLE":
+                self.title = value
+            elif re.match(r"^L\dLABEL$", key):
+                labels[int(key[1])] = value
+            elif re.match(r"^L\dFILE$", key) and value:
+                files[int(key[1])] = value
+
+        charts = []
+        for level in sorted(files):
+            path = os.path.join(self.directory, files[level].replace("\\", "/"))
+            if not os.path.exists(path):
+                print(f"Warning: Chart for level {level} not found: {path}")
+                continue
+            charts.append((labels.get(level) or f"Level {level}", Dtx(path)))
+
+        # One after another: parsing is pure Python and holds the GIL, so
+        # threads would not overlap, and a few charts parse faster than worker
+        # processes start. A per-chart summary replaces the progress output.
+        for _, dtx in charts:
+            dtx.parse(verbose=False)
+
+        for label, dtx in charts:
+            if dtx.timed_notes:
+                print(f"  {label}: {os.path.basename(dtx.dtx_path)} ({len(dtx.timed_notes)} notes)")
+            else:
+                print(f"Warning: Skipping difficulty '{label}', it has no notes.")
+        self.difficulties = [(label, dtx) for label, dtx in charts if dtx.timed_notes]
+        print(f"Song set '{self.title}' has {len(self.difficulties)} difficulties.")
+
+    def sample_paths(self):
+        """
+        Returns the union of sample files referenced by all difficulties,
+        excluding each chart's BGM, which is streamed rather than decoded.
+        """
+        paths = set()
+        for _, dtx in self.difficulties:
+            paths.update(
+                path for wav_id, path in dtx.wav_files.items() if wav_id != dtx.bgm_wav_id
+            )
+        return sorted(paths)
+
+
+# --- Lane Configuration (DTXMania Style) ---
+# Defines the order and appearance of each drum lane from left to right.
+# The 'color' is used for the static lane indicators at the bottom.
+LANE_DEFINITIONS = [
+    {"name": "L.Cym", "channels": ["1A"], "color": (255, 105, 180)},  # Hot Pink
+    {"name": "H.H.", "channels": ["11", "18"], "color": (0, 180, 255)},  # Light Blue
+    {"name": "Snare", "channels": ["12"], "color": (255, 0, 100)},  # Red/Pink
+    {
+        "name": "L.Foot",
+        "channels": ["1B", "1C"],
+        "color": (255, 255, 255),
+    },  # White Indicator
+    {"name": "H.Tom", "channels": ["14"], "color": (0, 220, 0)},  # Green
+    {"name": "Kick", "channels": ["13"], "color": (255, 255, 255)},  # White Indicator
+    {"name": "L.Tom", "channels": ["15"], "color": (255, 0, 0)},  # Red
+    {"name": "F.Tom", "channels": ["17"], "color": (255, 165, 0)},  # Orange
+    {"name": "R.Cym", "channels": ["16"], "color": (0, 180, 255)},  # Blue
+    {"name": "Ride", "channels": ["19"], "color": (0, 180, 255)},  # Blue
+]
+
+# Reverse map for quick channel-to-lane-index lookups.
+CHANNEL_TO_LANE_MAP = {
+    channel_id: i
+    for i, lane in enumerate(LANE_DEFINITIONS)
+    for channel_id in lane["channels"]
+}
+
+
+def open_chart(path, difficulty=1, on_resources=None):
+    """
+    Parses whatever the user pointed at: a single .dtx, a set.def, or a song
+    folder containing a set.def.
+
+    Args:
+        path (str): Path to a .dtx file, a set.def file or a song folder.
+        difficulty (int): Difficulty to start with for song sets (1 = first listed).
+        on_resources (callable, optional): Passed to Dtx.parse for single charts.
+
+    Returns:
+        tuple: (Dtx, SongSet | None). The Dtx is None if nothing playable was found.
+    """
+    set_def_path = None
+    if os.path.isdir(path):
+        set_def_path = SongSet.find_set_def(path)
+        if not set_def_path:
+            print(f"Error: No set.def found in '{path}'.")
+            return None, None
+    elif os.path.basename(path).lower() == "set.def":
+        set_def_path = path
+
+    if not set_def_path:
+        dtx_data = Dtx(path)
+        dtx_data.parse(on_resources)
+        return dtx_data, None
+
+    song_set = SongSet(set_def_path)
+    song_set.parse()
+    if not song_set.difficulties:
+        print("Error: The song set has no playable charts.")
+        return None, None
+    index = min(max(difficulty, 1), len(song_set.difficulties)) - 1
+    return song_set.difficulties[index][1], song_set
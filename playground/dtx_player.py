@@ -1,286 +1,381 @@
 import os
 import sys
-import re
 import time
+
+# Reference point for the startup timings reported by the player. Taken
+# before pygame is imported, since that import alone is noticeable.
+LAUNCH_TIME_S = time.perf_counter()
+
+# Only what the loading screen needs is imported up front; the judge, replay,
+# audio engine and tuning modules are imported where they are used, so the
+# loading window opens as soon as pygame itself is in (see run_startup_pipeline).
+
+import bisect
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import pygame
 
+# The parser lives in its own module so chart tools don't pull in pygame;
+# its API is re-exported here for scripts that only know the player.
+from dtx_parser import (  # noqa: F401
+    Dtx,
+    SongSet,
+    base36_to_int,
+    read_command_lines,
+    open_chart,
+    LANE_DEFINITIONS,
+    CHANNEL_TO_LANE_MAP,
+)
 
-def base36_to_int(s):
-    """Converts a base36 string (0-9, A-Z) to an integer."""
-    try:
-        return int(s, 36)
-    except (ValueError, TypeError):
-        return 0
+
+def get_ticks_ms():
+    """
+    Milliseconds since launch from the high-resolution system clock. Used
+    instead of pygame.time.get_ticks(), which needs a full pygame.init().
+    """
+    return (time.perf_counter() - LAUNCH_TIME_S) * 1000
 
 
-class Dtx:
+class BgaTextureCache:
     """
-    Parses a .dtx file, processes its metadata, and calculates the precise
-    timing of all musical events, including notes and BPM changes.
+    Keeps the images of a chart's BGA/BGI timeline ready as textures in the
+    display pixel format, so nothing is decoded at trigger time.
+
+    Images needed within LOOKAHEAD_MS of the playhead are loaded and scaled
+    on a worker thread; the main thread only convert()s finished images.
+    Total texture memory is capped: when full, the texture whose next use
+    lies furthest in the future (or never comes) is evicted first. An image
+    that isn't ready yet is simply not drawn, so the frame never waits.
     """
 
-    # Channels that do not represent playable notes and should be ignored
-    # when building the list of timed events. This includes visual and
-    # system channels for things like bar lines and BGA control.
-    NON_NOTE_CHANNELS = {
-        # Visual Layers & Control
-        "04", "07", "54", "5A", "C4", "C7",
-        "55", "56", "57", "58", "59", "60",
-        "D5", "D6", "D7", "D8", "D9", "DA", "DB", "DC", "DD", "DE", "DF",
-        # System (Bar lines, visibility toggles, etc.)
-        "50", "51", "C1", "C2",
-        # Sound Effect (SE) channels - these are autoplay sounds, not playable notes.
-        "61", "62", "63", "64", "65", "66", "67", "68", "69",
-        "70", "71", "72", "73", "74", "75", "76", "77", "78", "79",
-        "80", "81", "82", "83", "84", "85", "86", "87", "88", "89",
-        "90", "91", "92",
-    }
+    # DTXMania's drum-mode BGA area. #BGA clip coordinates refer to it, and
+    # it is scaled up as a whole to fit the screen area it is drawn into.
+    NATIVE_SIZE = (278, 355)
+    LOOKAHEAD_MS = 2000
+    NUM_LAYERS = 8
 
-    def __init__(self, dtx_path):
+    def __init__(self, dtx_data, rect, memory_limit_bytes, brightness=1.0):
         """
-        Initializes the Dtx object with the path to the .dtx file.
-
         Args:
-            dtx_path (str): The full path to the .dtx file.
+            dtx_data (Dtx): The parsed chart.
+            rect (pygame.Rect): Screen area to draw the BGA into.
+            memory_limit_bytes (int): Cap on the total size of cached textures.
+            brightness (float): Multiplier (0.0-1.0) baked into the textures.
+        """
+        self.scale = min(rect.width / self.NATIVE_SIZE[0], rect.height / self.NATIVE_SIZE[1])
+        self.canvas = pygame.Rect(
+            0, 0, self.NATIVE_SIZE[0] * self.scale, self.NATIVE_SIZE[1] * self.scale
+        )
+        self.canvas.center = rect.center
+        self.memory_limit_bytes = memory_limit_bytes
+        self.brightness = brightness
+
+        self.textures = {}  # Maps image path to its converted Surface
+        self.bytes_used = 0
+        self.pending = {}  # Maps image path to its decode Future
+        self.failed = set()  # Paths that could not be decoded
+        # Maps image path to its texture size, for decoded images there was no
+        # room for; they are only decoded again once room can be made for them
+        self.rejected = {}
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.set_chart(dtx_data)
+
+    def set_chart(self, dtx_data):
+        """Indexes a (new or reloaded) chart's BGA timeline. Cached textures are kept."""
+        self.dtx = dtx_data
+        self.events = dtx_data.bga_events
+        self.event_times = [e[0] for e in self.events]
+        # Per layer: parallel lists of chip times and chip IDs
+        self.layers = [([], []) for _ in range(self.NUM_LAYERS)]
+        self.uses = {}  # Maps image path to the sorted times it is shown at
+        for time_ms, layer, chip_id in self.events:
+            times, ids = self.layers[layer]
+            times.append(time_ms)
+            ids.append(chip_id)
+            path = self._resolve(chip_id)[0]
+            if path:
+                self.uses.setdefault(path, []).append(time_ms)
+
+    def _resolve(self, chip_id):
+        """
+        Returns (image_path, clip) for a chip. `clip` is (x1, y1, x2, y2, dx, dy)
+        for #BGAxx references and None for plain #BMPxx images.
+        """
+        if chip_id in self.dtx.bga_definitions:
+            bmp_id, *clip = self.dtx.bga_definitions[chip_id]
+            return self.dtx.bmp_files.get(bmp_id), tuple(clip)
+        return self.dtx.bmp_files.get(chip_id), None
+
+    def _visible_chips(self, current_time_ms):
+        """Returns the chip ID shown on each layer at the given time (or None)."""
+        visible = []
+        for times, ids in self.layers:
+            i = bisect.bisect_right(times, current_time_ms) - 1
+            visible.append(ids[i] if i >= 0 else None)
+        return visible
+
+    def visible_state(self, current_time_ms):
+        """What draw() would show right now, so unchanged frames can be skipped."""
+        return tuple(
+            (chip_id, self._resolve(chip_id)[0] in self.textures)
+            for chip_id in self._visible_chips(current_time_ms)
+        )
 
-        Raises:
-            FileNotFoundError: If the .dtx file does not exist.
-        """
-        if not os.path.exists(dtx_path):
-            raise FileNotFoundError(f"DTX file not found: {dtx_path}")
-        self.dtx_path = dtx_path
-        self.directory = os.path.dirname(dtx_path) or "."
-
-        # Metadata with default values
-        self.title = "Untitled"
-        self.artist = "Unknown"
-        self.bpm = 120.0
-
-        # Resource definitions
-        self.wav_files = {}  # Maps WAV ID (str) to its file path
-        self.bpm_changes = {}  # Maps BPM ID (str) to a BPM value (float)
-        self.bar_length_changes = {}  # Maps bar number to a length multiplier (float)
-        self.wav_volumes = {}  # Maps WAV ID to volume (0-100) from #VOLUME
-        self.bgm_wav_id = None
-        self.bgm_start_time_ms = 0.0
-
-        # The final calculated event list
-        self.timed_notes = []  # List of (time_in_ms, wav_id_str)
-
-    def _split_line(self, line):
-        """
-        Helper to robustly split a DTX command line into a key and value.
-        Handles commands with and without values.
-        """
-        # Prioritize colon as it's a more definitive separator
-        if ":" in line:
-            key, value = line.split(":", 1)
-            return key, value
-        # Fallback to the first space for commands like '#BPM 120'
-        elif " " in line:
-            key, value = line.split(" ", 1)
-            return key, value
-        # Handle commands with no value, like '#END'
-        return line, ""
-
-    def parse(self):
-        """
-        Parses the DTX file in two main stages:
-        1. First Pass: Gathers all definitions (metadata, WAVs, BPMs, bar lengths).
-        2. Second Pass: Processes the timeline, calculating the precise time
-           for each event based on the current BPM and bar lengths.
-        """
-        print(f"Parsing '{os.path.basename(self.dtx_path)}'...")
-
-        raw_events = []
-
-        # --- First Pass: Gather all definitions from the file ---
-        # Try to read the file with multiple encodings and choose the one that
-        # produces the most valid-looking DTX command lines (starting with '#').
-        best_content = None
-        best_encoding = None
-        max_command_lines = 0
-
-        # Common encodings for DTX files, with cp932 (Shift-JIS) often being correct.
-        for encoding in ["cp932", "utf-16-le", "utf-8-sig", "utf-8"]:
+    def _decode(self, path):
+        """Worker: loads an image and scales it to the BGA canvas."""
+        image = pygame.image.load(path)
+        width, height = image.get_size()
+        size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        if image.get_bitsize() >= 24:
+            image = pygame.transform.smoothscale(image, size)
+        else:
+            image = pygame.transform.scale(image, size)
+        if self.brightness < 1.0:
+            level = int(255 * self.brightness)
+            image.fill((level, level, level), special_flags=pygame.BLEND_MULT)
+        return image
+
+    def _next_use(self, path, current_time_ms):
+        times = self.uses.get(path, [])
+        i = bisect.bisect_left(times, current_time_ms)
+        return times[i] if i < len(times) else float("inf")
+
+    def update(self, current_time_ms):
+        """
+        Called once per frame: stores finished decodes and queues the images
+        needed now and within the lookahead window.
+        """
+        visible_paths = {
+            self._resolve(chip_id)[0]
+            for chip_id in self._visible_chips(current_time_ms)
+            if chip_id is not None
+        }
+
+        for path, future in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[path]
             try:
-                with open(self.dtx_path, "r", encoding=encoding) as f:
-                    lines = f.readlines()
-
-                # Heuristic: The correct encoding should yield many command lines.
-                command_lines = sum(1 for line in lines if line.strip().startswith("#"))
+                image = future.result()
+            except (pygame.error, FileNotFoundError) as e:
+                print(f"Warning: Could not load BGA image '{os.path.basename(path)}'. Error: {e}")
+                self.failed.add(path)
+                continue
 
-                if command_lines > max_command_lines:
-                    max_command_lines = command_lines
-                    best_content = lines
-                    best_encoding = encoding
+            if image.get_flags() & pygame.SRCALPHA:
+                texture = image.convert_alpha()
+            else:
+                texture = image.convert()
+                texture.set_colorkey((0, 0, 0))  # Black is transparent on upper layers
+            size = self._texture_bytes(texture)
+            if self._make_room(size, path, current_time_ms, visible_paths):
+                self.textures[path] = texture
+                self.bytes_used += size
+                self.rejected.pop(path, None)
+            else:
+                self.rejected[path] = size
+
+        end = bisect.bisect_right(self.event_times, current_time_ms + self.LOOKAHEAD_MS)
+        start = bisect.bisect_left(self.event_times, current_time_ms)
+        needed = visible_paths | {
+            self._resolve(chip_id)[0] for _, _, chip_id in self.events[start:end]
+        }
+        for path in needed:
+            if path and path not in self.textures and path not in self.pending:
+                if path in self.rejected and not self._room_possible(
+                    path, current_time_ms, visible_paths
+                ):
+                    continue
+                if path not in self.failed:
+                    self.pending[path] = self.pool.submit(self._decode, path)
 
-            except (UnicodeDecodeError, UnicodeError):
-                continue  # This encoding is incorrect, try the next one.
-            except Exception as e:
-                print(f"An unexpected error occurred while reading with {encoding}: {e}")
+    @staticmethod
+    def _texture_bytes(texture):
+        return texture.get_bytesize() * texture.get_width() * texture.get_height()
 
-        if not best_content:
-            print("Error: Could not read or decode the file with any supported encodings.")
-            return
+    def _next_use_or_now(self, path, current_time_ms, visible_paths):
+        if path in visible_paths:
+            return current_time_ms
+        return self._next_use(path, current_time_ms)
 
-        content = best_content
-        print(
-            f"Successfully read file using encoding '{best_encoding}' ({max_command_lines} command lines found)."
+    def _room_possible(self, path, current_time_ms, visible_paths):
+        """
+        Whether a rejected image would now be kept: it fits in the free
+        memory, or evicting textures needed later than it would make it fit.
+        """
+        size = self.rejected[path]
+        if size > self.memory_limit_bytes:
+            return False
+        new_next_use = self._next_use_or_now(path, current_time_ms, visible_paths)
+        evictable = sum(
+            self._texture_bytes(texture)
+            for p, texture in self.textures.items()
+            if self._next_use_or_now(p, current_time_ms, visible_paths) > new_next_use
         )
+        return self.bytes_used - evictable + size <= self.memory_limit_bytes
 
-        for line in content:
-            line = line.strip()
-            if not line or not line.startswith("#"):
-                continue
-
-            raw_key, raw_value = self._split_line(line[1:])
-
-            key = raw_key.strip().upper()
-            value = raw_value.strip().split(";")[0].strip()  # Remove comments
-
-            if key == "TITLE":
-                self.title = value
-            elif key == "ARTIST":
-                self.artist = value
-            elif key == "BPM" and value:
-                try:
-                    self.bpm = float(value)
-                except ValueError:
-                    print(f"Warning: Invalid BPM value '{value}'")
-            elif key.startswith("WAV") and value:
-                # Normalize path separators to handle DTX files from Windows
-                normalized_value = value.replace("\\", "/")
-                self.wav_files[key[3:]] = os.path.join(self.directory, normalized_value)
-            elif key == "BGMWAV" and value:
-                self.bgm_wav_id = value
-            elif key.startswith("BPM") and len(key) > 3 and value:
-                try:
-                    self.bpm_changes[key[3:]] = float(value)
-                except ValueError:
-                    print(f"Warning: Invalid BPM change value '{value}'")
-            elif key.startswith("VOLUME") and len(key) > 6 and value:
-                wav_id = key[6:]
-                try:
-                    self.wav_volumes[wav_id] = int(value)
-                except (ValueError, TypeError):
-                    print(
-                        f"Warning: Invalid VOLUME value '{value}' for WAV ID {wav_id}"
-                    )
-            # Check for note/event data lines (e.g., #00108: ...)
-            elif len(key) == 5 and re.match(r"^\d{3}[0-9A-Z]{2}$", key):
-                bar_num = int(key[0:3])
-                channel = key[3:5]
-
-                # Handle bar length changes, which are not standard chip events
-                if channel == "02":
-                    if value:
-                        try:
-                            # Bar length is a direct float value in the DTX file
-                            self.bar_length_changes[bar_num] = float(value)
-                        except (ValueError, TypeError):
-                            print(
-                                f"Warning: Invalid bar length value '{value}' for bar {bar_num}"
-                            )
-                    continue  # Do not process as a note event
+    def _make_room(self, size, path, current_time_ms, visible_paths):
+        """
+        Evicts textures, furthest next use first, until `size` more bytes fit.
 
-                # Ignore other non-note channels (visual, system, etc.)
-                if channel in self.NON_NOTE_CHANNELS:
-                    continue
+        Returns:
+            bool: False if the new texture itself is the one best left out.
+        """
+        def next_use(p):
+            return self._next_use_or_now(p, current_time_ms, visible_paths)
+
+        new_next_use = next_use(path)
+        while self.bytes_used + size > self.memory_limit_bytes and self.textures:
+            victim = max(self.textures, key=next_use)
+            if next_use(victim) <= new_next_use:
+                return False
+            self.bytes_used -= self._texture_bytes(self.textures.pop(victim))
+        return self.bytes_used + size <= self.memory_limit_bytes
+
+    def draw(self, screen, current_time_ms):
+        """Draws every BGA layer, bottom first."""
+        screen.set_clip(self.canvas)
+        for chip_id in self._visible_chips(current_time_ms):
+            if chip_id is None:
+                continue
+            path, clip = self._resolve(chip_id)
+            texture = self.textures.get(path)
+            if texture is None:
+                continue  # Still decoding; never stall the frame waiting for it
+            if clip:
+                x1, y1, x2, y2, dx, dy = (c * self.scale for c in clip)
+                area = pygame.Rect(x1, y1, x2 - x1, y2 - y1)
+                screen.blit(texture, (self.canvas.x + dx, self.canvas.y + dy), area)
+            else:
+                screen.blit(texture, self.canvas.topleft)
+        screen.set_clip(None)
 
-                if not value:
-                    continue
+    def shutdown(self):
+        """Discards queued decodes."""
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
-                notes = [value[i : i + 2] for i in range(0, len(value), 2)]
-                if not notes:
-                    continue
 
-                total_notes = len(notes)
-                for i, note_val in enumerate(notes):
-                    if note_val != "00":
-                        raw_events.append(
-                            {
-                                "bar": bar_num,
-                                "channel": channel,
-                                "pos": i,
-                                "total_pos": total_notes,
-                                "val": note_val,
-                            }
-                        )
+class FramePacer:
+    """
+    Paces the player loop instead of spinning at a fixed rate.
+
+    Simulation ticks (input, clock, triggers) run at least every
+    TICK_INTERVAL_S and right when the next note is due, sleeping in
+    between. Frames are presented at the display refresh rate; the player
+    skips frames whose content would not change. CPU use (all threads of
+    the process, as a share of one core) is measured per BUDGET_WINDOW_S.
+    With a CPU budget, the frame rate is lowered while the budget is
+    exceeded and raised again once there is headroom. Simulation ticks are
+    never throttled, so timing accuracy does not depend on the budget.
+    """
 
-        # If BGMWAV is not specified, default to WAV01, a common convention
-        if not self.bgm_wav_id and "01" in self.wav_files:
-            self.bgm_wav_id = "01"
+    TICK_INTERVAL_S = 0.002  # Longest sleep between simulation ticks (input latency)
+    DEFAULT_REFRESH_RATE = 60  # Used when the display cannot report its rate
+    MIN_FPS = 20  # The CPU budget never pushes presentation below this
+    BUDGET_WINDOW_S = 1.0
+    FPS_STEP = 0.8  # Frame rate factor per window over budget (inverse when under)
 
-        print(
-            f"Found {len(self.wav_files)} WAVs, {len(self.bar_length_changes)} bar length changes, and {len(raw_events)} raw events."
+    def __init__(self, refresh_rate, max_fps=None, cpu_budget=None):
+        """
+        Args:
+            refresh_rate (int): Display refresh rate in Hz.
+            max_fps (int, optional): Upper limit for the frame rate.
+            cpu_budget (float, optional): Share of one core (e.g. 0.25) to stay under.
+        """
+        self.refresh_rate = refresh_rate
+        self.target_fps = min(refresh_rate, max_fps) if max_fps else refresh_rate
+        self.fps = self.target_fps  # Current frame rate, after the budget
+        self.cpu_budget = cpu_budget
+        self.cpu_load = 0.0  # CPU share measured over the last window
+
+        now_s = time.perf_counter()
+        self.next_frame_s = now_s
+        self.window_start_s = now_s
+        self.window_start_cpu_s = time.process_time()
+
+        # Totals for the report at the end of the song
+        self.started_s = now_s
+        self.started_cpu_s = self.window_start_cpu_s
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+        self.draw_total_s = 0.0
+        self.draw_max_s = 0.0
+
+    @classmethod
+    def display_refresh_rate(cls):
+        """Refresh rate of the current display, if pygame can tell (pygame-ce can)."""
+        get_rate = getattr(pygame.display, "get_current_refresh_rate", None)
+        try:
+            rate = get_rate() if get_rate else 0
+        except pygame.error:
+            rate = 0
+        return rate or cls.DEFAULT_REFRESH_RATE
+
+    def frame_due(self, now_s):
+        """True once per frame interval."""
+        if now_s < self.next_frame_s:
+            return False
+        self.next_frame_s += 1.0 / self.fps
+        if self.next_frame_s < now_s:
+            self.next_frame_s = now_s + 1.0 / self.fps  # Fell behind; don't catch up in a burst
+        return True
+
+    def frame_drawn(self, draw_time_s):
+        self.frames_drawn += 1
+        self.draw_total_s += draw_time_s
+        self.draw_max_s = max(self.draw_max_s, draw_time_s)
+
+    def frame_skipped(self):
+        self.frames_skipped += 1
+
+    def sleep(self, deadline_s=float("inf")):
+        """
+        Sleeps until the next simulation tick, the next frame or
+        `deadline_s` (perf_counter time), whichever comes first.
+        """
+        now_s = time.perf_counter()
+        wake_s = min(deadline_s, self.next_frame_s, now_s + self.TICK_INTERVAL_S)
+        if wake_s > now_s:
+            time.sleep(wake_s - now_s)
+
+        now_s = time.perf_counter()
+        if now_s - self.window_start_s >= self.BUDGET_WINDOW_S:
+            cpu_s = time.process_time()
+            self.cpu_load = (cpu_s - self.window_start_cpu_s) / (now_s - self.window_start_s)
+            self.window_start_s = now_s
+            self.window_start_cpu_s = cpu_s
+            self._apply_budget()
+
+    def _apply_budget(self):
+        if not self.cpu_budget:
+            return
+        if self.cpu_load > self.cpu_budget and self.fps > self.MIN_FPS:
+            self.fps = max(self.MIN_FPS, round(self.fps * self.FPS_STEP))
+            print(
+                f"CPU {self.cpu_load * 100:.0f}% is over the {self.cpu_budget * 100:.0f}% "
+                f"budget; frame rate lowered to {self.fps} fps."
+            )
+        elif self.cpu_load < self.cpu_budget * self.FPS_STEP and self.fps < self.target_fps:
+            self.fps = min(self.target_fps, round(self.fps / self.FPS_STEP))
+
+    def describe(self):
+        budget = f", CPU budget {self.cpu_budget * 100:.0f}%" if self.cpu_budget else ""
+        return f"Frame pacing: {self.target_fps} fps (display {self.refresh_rate} Hz){budget}."
+
+    def status_text(self):
+        return f"Frames: {self.fps} fps, CPU {self.cpu_load * 100:.0f}%"
+
+    def report(self):
+        elapsed_s = max(time.perf_counter() - self.started_s, 1e-9)
+        cpu_load = (time.process_time() - self.started_cpu_s) / elapsed_s
+        average_ms = self.draw_total_s / self.frames_drawn * 1000 if self.frames_drawn else 0.0
+        return (
+            f"Frames: {self.frames_drawn} drawn, {self.frames_skipped} skipped as unchanged, "
+            f"draw time {average_ms:.1f} ms average / {self.draw_max_s * 1000:.1f} ms worst; "
+            f"CPU {cpu_load * 100:.0f}% of one core."
         )
 
-        # --- Second Pass: Calculate event timings ---
-        # Pre-calculate the starting beat of each bar to handle time signature changes
-        max_bar = 0
-        if raw_events:
-            max_bar = max(e["bar"] for e in raw_events)
-
-        bar_start_beats = {0: 0.0}
-        for i in range(max_bar + 1):
-            bar_length_multiplier = self.bar_length_changes.get(i, 1.0)
-            beats_in_bar = 4.0 * bar_length_multiplier
-            bar_start_beats[i + 1] = bar_start_beats[i] + beats_in_bar
-
-        # Annotate each event with its precise global beat number
-        for event in raw_events:
-            bar_num = event["bar"]
-            # Get the length of the specific bar the event is in
-            bar_len_multiplier = self.bar_length_changes.get(bar_num, 1.0)
-            beats_in_this_bar = 4.0 * bar_len_multiplier
-
-            # Position within the bar (0.0 to 1.0) * beats in this bar
-            event_beat_in_bar = (event["pos"] / event["total_pos"]) * beats_in_this_bar
-
-            # Global beat is the sum of beats before this bar + beat pos in this bar
-            event["global_beat"] = bar_start_beats[bar_num] + event_beat_in_bar
-
-        # Sort events by their calculated global beat to process them chronologically
-        raw_events.sort(key=lambda x: x["global_beat"])
-
-        current_time_s = 0.0
-        current_bpm = self.bpm
-        last_event_beat = 0.0
-        first_bgm_event_processed = False
-
-        for event in raw_events:
-            # Calculate time elapsed since the last event using the current BPM
-            delta_beats = event["global_beat"] - last_event_beat
-            delta_time_s = delta_beats * (60.0 / current_bpm)
-            event_time_s = current_time_s + delta_time_s
-
-            # Process the event based on its channel to see if it's a note or a BPM change
-            channel, value = event["channel"], event["val"]
-
-            if channel == "01":  # BGM event
-                if not first_bgm_event_processed:
-                    self.bgm_start_time_ms = event_time_s * 1000
-                    first_bgm_event_processed = True
-                # BGM events aren't notes, so we don't add them to the list.
-            elif channel == "03":  # Direct BPM change (hexadecimal value)
-                try:
-                    current_bpm = float(int(value, 16))
-                except (ValueError, TypeError):
-                    print(f"Warning: Invalid direct BPM value '{value}'")
-            elif channel == "08":  # BPM change from predefined list
-                if value in self.bpm_changes:
-                    current_bpm = self.bpm_changes[value]
-            else:  # Any other channel is a note.
-                self.timed_notes.append((event_time_s * 1000, channel, value))
-
-            # Update state for the next iteration
-            current_time_s = event_time_s
-            last_event_beat = event["global_beat"]
-
-        self.timed_notes.sort()
-        print(f"Successfully parsed {len(self.timed_notes)} timed notes.")
-
 
 class Player:
     """
@@ -303,6 +398,13 @@ class Player:
     SCROLL_TIME_MS = 1500  # Time in ms for a note to travel the highway
     PROGRESS_BAR_WIDTH = 20  # Vertical progress bar on the side
     JUMP_AMOUNT_S = 5.0  # Jump 5 seconds
+    ENGINE_LOOKAHEAD_MS = 100  # How far ahead notes are handed to the audio process
+    IDLE_REDRAW_MS = 100  # Redraw interval while nothing moves on screen
+    # How often watch mode checks the chart file. A stat costs microseconds, so
+    # this can stay short and keep the edit-to-listen loop well under 100 ms.
+    WATCH_POLL_INTERVAL_S = 0.02
+    BGA_MEMORY_LIMIT_MB = 256  # Cap on decoded BGA textures
+    BGA_BRIGHTNESS = 0.5  # Dim the BGA so notes stay readable on top of it
 
     # Colors
     COLOR_BACKGROUND = (0, 0, 0)  # Black background like DTXMania
@@ -311,31 +413,9 @@ class Player:
     COLOR_TEXT = (220, 220, 255)
 
     # --- Lane Configuration (DTXMania Style) ---
-    # Defines the order and appearance of each drum lane from left to right.
-    # The 'color' is used for the static lane indicators at the bottom.
-    LANE_DEFINITIONS = [
-        {"name": "L.Cym", "channels": ["1A"], "color": (255, 105, 180)},  # Hot Pink
-        {"name": "H.H.", "channels": ["11", "18"], "color": (0, 180, 255)},  # Light Blue
-        {"name": "Snare", "channels": ["12"], "color": (255, 0, 100)},  # Red/Pink
-        {
-            "name": "L.Foot",
-            "channels": ["1B", "1C"],
-            "color": (255, 255, 255),
-        },  # White Indicator
-        {"name": "H.Tom", "channels": ["14"], "color": (0, 220, 0)},  # Green
-        {"name": "Kick", "channels": ["13"], "color": (255, 255, 255)},  # White Indicator
-        {"name": "L.Tom", "channels": ["15"], "color": (255, 0, 0)},  # Red
-        {"name": "F.Tom", "channels": ["17"], "color": (255, 165, 0)},  # Orange
-        {"name": "R.Cym", "channels": ["16"], "color": (0, 180, 255)},  # Blue
-        {"name": "Ride", "channels": ["19"], "color": (0, 180, 255)},  # Blue
-    ]
-
-    # Create a reverse map for quick channel-to-lane-index lookups.
-    CHANNEL_TO_LANE_MAP = {
-        channel_id: i
-        for i, lane in enumerate(LANE_DEFINITIONS)
-        for channel_id in lane["channels"]
-    }
+    # Shared with the parser module, see dtx_parser.LANE_DEFINITIONS.
+    LANE_DEFINITIONS = LANE_DEFINITIONS
+    CHANNEL_TO_LANE_MAP = CHANNEL_TO_LANE_MAP
 
     # Define specific colors for certain note types within a lane (e.g., Open Hi-Hat).
     # This overrides the base note color.
@@ -358,28 +438,58 @@ class Player:
         "1B": ["18"],  # Pedal HH chokes Open HH
     }
 
-    def __init__(self, dtx_data):
+    # --- Pad Input ---
+    # Keyboard keys acting as pads, mapped to lane indices (see LANE_DEFINITIONS).
+    PAD_KEYS = {
+        pygame.K_a: 0,  # L.Cym
+        pygame.K_s: 1,  # H.H.
+        pygame.K_d: 2,  # Snare
+        pygame.K_f: 3,  # L.Foot
+        pygame.K_g: 4,  # H.Tom
+        pygame.K_SPACE: 5,  # Kick
+        pygame.K_h: 6,  # L.Tom
+        pygame.K_j: 7,  # F.Tom
+        pygame.K_k: 8,  # R.Cym
+        pygame.K_l: 9,  # Ride
+    }
+
+    def __init__(
+        self,
+        dtx_data,
+        watch=False,
+        song_set=None,
+        bga=True,
+        bga_memory_mb=None,
+        stems=False,
+        record_dir=None,
+        engine=None,
+        max_fps=None,
+        cpu_budget=None,
+        sample_store=None,
+    ):
         self.dtx = dtx_data
+        self.song_set = song_set  # Other difficulties that can be switched to
         self.sounds = {}
+        self.sound_cache = {}  # Maps sample file path to its decoded Sound
         self.bgm_path = None  # Will store the path to the BGM file
+        self.bgm_offset_ms = 0.0  # Chart time at which the BGM file starts
+
+        # Compact sample storage (see SampleStore); rarely used long samples
+        # are then only kept in memory around their uses (see DeferredSamples)
+        self.sample_store = sample_store
+        self.deferred_samples = None  # Created in play method
+        self.mixer_channels = None  # Channel count set by fit_mixer_channels
+
+        # Autoplay stems: all BGM/SE chips pre-mixed into one streamed file
+        self.use_stems = stems
+        self.stem_paths = {}  # Maps Dtx to its rendered stem (None if it has no autoplay chips)
         self.hit_animations = []  # Stores recent note hits for visual feedback
 
         # --- Audio State Management ---
-        # For polyphony: Stores active channels for each instrument lane.
-        # Structure: { channel_id: [ (channel_object, play_time_ms), ... ] }
-        self.active_poly_sounds = {}
-
-        # For choke logic: Stores the active channel for chokeable sounds.
-        # Structure: { channel_id: channel_object }
-        self.active_choke_sounds = {}
-        # Pre-calculate which channels can BE choked for faster lookups.
-        self.CHOKEABLE_CHANNELS = list(
-            set(
-                choked
-                for choker, choked_list in self.CHOKE_MAP.items()
-                for choked in choked_list
-            )
-        )
+        # With an AudioEngine the mixer, samples and voices live in a separate
+        # process; self.sounds then holds sample indices instead of Sounds.
+        self.engine = engine
+        self.music = engine.music if engine else pygame.mixer.music
 
         self.time_offset_ms = 0  # Stores seek position for audio-driven clock
         self.bgm_volume = 0.7  # Default BGM volume, adjustable with Up/Down keys
@@ -391,42 +501,270 @@ class Player:
         self.se_fade_out_ms = 100  # quick release when choked
         self.bgm_fade_ms = 400  # fade-in/out time for BGM on start/seek
 
+        # Polyphony and choke handling (see VoiceManager)
+        voice_options = (
+            self.CHOKE_MAP,
+            self.POLYPHONY_LIMIT,
+            self.se_fade_in_ms,
+            self.se_fade_out_ms,
+        )
+        self.voices = None
+        if engine:
+            engine.configure_voices(*voice_options).result()
+        else:
+            from audio_engine import VoiceManager
+
+            self.voices = VoiceManager(*voice_options)
+
+        # --- Song set (difficulty switching) ---
+        self.difficulty_label = None
+        if song_set:
+            for label, dtx in song_set.difficulties:
+                if dtx is dtx_data:
+                    self.difficulty_label = label
+
+        # --- Watch mode (hot-reload of edited charts) ---
+        self.watch = watch
+        self._watched_mtime = None
+        self._last_watch_poll_s = 0.0
+        if watch:
+            self._watched_mtime = os.stat(self.dtx.dtx_path).st_mtime_ns
+
+        # --- BGA (texture cache created in play method) ---
+        self.bga_enabled = bga
+        self.bga_memory_mb = bga_memory_mb or self.BGA_MEMORY_LIMIT_MB
+        self.bga = None
+
+        # --- Judgment and replay recording (one session per chart played) ---
+        self.record_dir = record_dir  # Replays are only saved when set
+        self.judge = None
+        self.recorder = None
+        self.last_judgment = None
+
+        # --- Frame pacing (see FramePacer; created in play method) ---
+        self.max_fps = max_fps
+        self.cpu_budget = cpu_budget
+        self.pacer = None
+
         # --- Fonts (initialized in play method) ---
         self.font = None
         self.small_font = None
 
+        if not engine:
+            self.init_audio()
+
+    @staticmethod
+    def init_audio(latency_mode=None, settings=None):
+        """
+        Opens the audio device. Only the mixer is initialized, not every
+        pygame subsystem; does nothing if the mixer is already running.
+
+        Args:
+            latency_mode (str, optional): One of LATENCY_MODES; picks the
+                sample rate and buffer size (see audio_settings). Defaults to
+                DEFAULT_LATENCY_MODE.
+            settings (tuple, optional): (sample rate, buffer size) already
+                picked by audio_settings for this latency mode.
+        """
+        if pygame.mixer.get_init():
+            return
+        from audio_tuning import DEFAULT_LATENCY_MODE, DEFAULT_MIXER_CHANNELS, audio_settings
+
+        latency_mode = latency_mode or DEFAULT_LATENCY_MODE
         print("\nInitializing Pygame audio...")
-        pygame.mixer.pre_init(44100, -16, 2, 1024)
-        pygame.init()
-        # Allocate more channels for complex drum patterns
-        pygame.mixer.set_num_channels(64)
-        print("Pygame audio initialized.")
-
-    def load_sounds(self):
-        """Loads all audio files defined in the DTX data into memory."""
-        print("Loading audio files...")
+        frequency, buffer_size = settings or audio_settings(latency_mode)
+        pygame.mixer.pre_init(frequency, -16, 2, buffer_size)
+        pygame.mixer.init()
+        # Enough channels for complex drum patterns until fit_mixer_channels runs
+        pygame.mixer.set_num_channels(DEFAULT_MIXER_CHANNELS)
+        print(
+            f"Pygame audio initialized ({frequency} Hz, {buffer_size}-frame buffer = "
+            f"{buffer_size / frequency * 1000:.1f} ms, latency mode '{latency_mode}')."
+        )
+
+    def fit_mixer_channels(self, grow_only=False):
+        """
+        Sizes the mixer's channel count to the peak polyphony of the chart
+        (of every difficulty, for song sets) instead of a fixed count.
+
+        Args:
+            grow_only (bool): Never lower the count. Used while playing, since
+                dropping channels cuts the voices still sounding on them.
+        """
+        from audio_tuning import mixer_channels, peak_polyphony
+
+        if self.engine:
+            lengths_s = self.engine.sample_lengths().result()
+
+            def length_ms(sound):
+                return lengths_s[sound] * 1000
+        else:
+            def length_ms(sound):
+                return sound.get_length() * 1000
+
+        charts = [chart for _, chart in self.song_set.difficulties] if self.song_set else [self.dtx]
+        peak = 0
+        for chart in charts:
+            notes = []
+            for time_ms, channel_id, wav_id in chart.timed_notes:
+                path = chart.wav_files.get(wav_id)
+                sound = self.sound_cache.get(path)
+                if sound is not None:
+                    notes.append((time_ms, channel_id, length_ms(sound)))
+                elif self.deferred_samples and self.deferred_samples.is_deferred(path):
+                    # Out of memory until shortly before use; the store knows its length
+                    length_s = self.sample_store.info[path]["length_s"]
+                    notes.append((time_ms, channel_id, length_s * 1000))
+            peak = max(
+                peak,
+                peak_polyphony(notes, self.POLYPHONY_LIMIT, self.CHOKE_MAP, self.se_fade_out_ms),
+            )
+
+        channels = mixer_channels(peak)
+        if grow_only and self.mixer_channels and channels <= self.mixer_channels:
+            return
+        self.mixer_channels = channels
+        if self.engine:
+            self.engine.set_num_channels(channels).result()
+        else:
+            pygame.mixer.set_num_channels(channels)
+        print(f"Mixer channels: {channels} (peak polyphony {peak}).")
+
+    def _load_sound(self, path):
+        """
+        Returns the decoded Sound for a sample file (its sample index when
+        an audio engine owns the samples), decoding it only if no chart
+        loaded it before.
+
+        Raises:
+            pygame.error: If the file cannot be decoded.
+        """
+        sound = self.sound_cache.get(path)
+        if sound is None:
+            if self.engine:
+                sound = self.engine.load_sample(path).result()
+            elif self.sample_store:
+                sound = self.sample_store.load(path)
+            else:
+                sound = pygame.mixer.Sound(path)
+            self.sound_cache[path] = sound
+        return sound
+
+    def prepare_stem(self, dtx_data):
+        """
+        Renders the autoplay stem for a chart, or fetches it from the stem
+        cache. Safe to call from worker threads.
+
+        Returns:
+            str | None: Path to the stem, or None if there is nothing to render.
+        """
+        self.prepare_stems([dtx_data])
+        return self.stem_paths.get(dtx_data)
+
+    def prepare_stems(self, charts):
+        """
+        Renders (or fetches from the stem cache) the autoplay stems of
+        several charts at once, so samples they share such as the BGM are
+        decoded only once (see render_stems). Safe to call from worker threads.
+        """
+        charts = [chart for chart in charts if chart not in self.stem_paths]
+        if not charts:
+            return
+        try:
+            if self.engine:
+                # The samples live in the audio process, so it renders there
+                stem_paths = self.engine.render_stems(charts).result()
+            else:
+                from autoplay_stem import render_stems
+
+                stem_paths = render_stems(charts, self.sound_cache)
+        except ImportError:
+            print("Warning: Autoplay stems need NumPy; playing the BGM without them.")
+            self.use_stems = False
+            return
+        self.stem_paths.update(zip(charts, stem_paths))
+
+    def _bgm_source(self, dtx_data):
+        """
+        Picks the file that is streamed as BGM for a chart: its autoplay stem
+        if stems are enabled, otherwise its BGM WAV.
+
+        Returns:
+            tuple: (path or None, chart time in ms at which the file starts).
+        """
+        if self.use_stems:
+            stem_path = self.prepare_stem(dtx_data)
+            if stem_path:
+                return stem_path, 0.0
+        path = dtx_data.wav_files.get(dtx_data.bgm_wav_id)
+        if path and not os.path.exists(path):
+            path = None
+        return path, dtx_data.bgm_start_time_ms
+
+    def load_sounds(self, wav_ids=None):
+        """
+        Loads audio files defined in the DTX data into memory.
+
+        When playing a song set, the samples of every difficulty are decoded
+        up front so switching charts later needs no decoding at all.
+
+        Args:
+            wav_ids (iterable, optional): Only (re)load these WAV IDs. Used by
+                watch mode to pick up newly referenced samples without decoding
+                the whole set again. Loads every defined WAV when omitted.
+        """
+        partial = wav_ids is not None
+        if partial:
+            # Drop sounds whose WAV definition was removed from the chart
+            for stale_id in set(self.sounds) - set(self.dtx.wav_files):
+                del self.sounds[stale_id]
+            wav_ids = [w for w in wav_ids if w in self.dtx.wav_files]
+        else:
+            print("Loading audio files...")
+            wav_ids = list(self.dtx.wav_files)
+            if self.song_set:
+                for path in self.song_set.sample_paths():
+                    if os.path.exists(path):
+                        try:
+                            self._load_sound(path)
+                        except pygame.error as e:
+                            print(
+                                f"Warning: Could not load '{os.path.basename(path)}'. Error: {e}"
+                            )
+                print(f"{len(self.sound_cache)} samples decoded for the whole song set.")
+
+        if not partial:
+            self.bgm_path, self.bgm_offset_ms = self._bgm_source(self.dtx)
+
         loaded_count = 0
-        for wav_id, path in self.dtx.wav_files.items():
+        for wav_id in wav_ids:
+            path = self.dtx.wav_files[wav_id]
             if not os.path.exists(path):
                 print(f"Warning: Audio file not found for WAV ID {wav_id}: {path}")
                 continue
 
             # Separate BGM from other sound effects
             if wav_id == self.dtx.bgm_wav_id:
-                self.bgm_path = path
                 continue  # Don't load BGM as a normal sound
+            if self.deferred_samples and self.deferred_samples.is_deferred(path):
+                continue  # Loaded shortly before use (see DeferredSamples)
 
             try:
-                sound = pygame.mixer.Sound(path)
-                self.sounds[wav_id] = sound
+                self.sounds[wav_id] = self._load_sound(path)
                 loaded_count += 1
             except pygame.error as e:
                 print(f"Warning: Could not load '{os.path.basename(path)}'. Error: {e}")
 
+        if partial:
+            return
+        self.fit_mixer_channels()
+
         if self.bgm_path:
             try:
-                pygame.mixer.music.load(self.bgm_path)
-                pygame.mixer.music.set_volume(self.bgm_volume)
+                self.music.load(self.bgm_path)
+                self.music.set_volume(self.bgm_volume)
+                if self.bgm_offset_ms == 0.0 and self.dtx in self.stem_paths:
+                    print("Autoplay stem loaded as BGM.")
                 print(f"BGM loaded. Volume set to {self.bgm_volume * 100:.0f}%.")
             except pygame.error as e:
                 print(
@@ -438,6 +776,143 @@ class Player:
             f"{len(self.sounds)} sound effects loaded (out of {len(self.dtx.wav_files)} defined)."
         )
 
+    def switch_difficulty(self, index, current_time_ms):
+        """
+        Switches to another difficulty of the song set while playing.
+
+        Samples come from the shared cache, and the BGM keeps streaming when
+        both charts use the same file. A chart without a BGM keeps the
+        current one playing.
+
+        Args:
+            index (int): Index into song_set.difficulties.
+            current_time_ms (float): The current chart playhead.
+        """
+        self.difficulty_label, dtx_data = self.song_set.difficulties[index]
+        self.dtx = dtx_data
+        self.load_sounds(dtx_data.wav_files)
+
+        new_bgm_path, new_bgm_offset_ms = self._bgm_source(dtx_data)
+
+        if new_bgm_path == self.bgm_path:
+            # Keep the audio-driven clock aligned if the first BGM chip moved
+            self.time_offset_ms += new_bgm_offset_ms - self.bgm_offset_ms
+            self.bgm_offset_ms = new_bgm_offset_ms
+        elif new_bgm_path:
+            try:
+                self.music.load(new_bgm_path)
+                self.music.set_volume(self.bgm_volume)
+                music_start_pos_ms = current_time_ms - new_bgm_offset_ms
+                self.music.play(
+                    start=max(0, music_start_pos_ms / 1000.0), fade_ms=self.bgm_fade_ms
+                )
+                self.bgm_path = new_bgm_path
+                self.bgm_offset_ms = new_bgm_offset_ms
+                self.time_offset_ms = current_time_ms
+            except pygame.error as e:
+                print(
+                    f"Warning: Could not load BGM '{os.path.basename(new_bgm_path)}'. Error: {e}"
+                )
+
+        print(f"Switched to difficulty '{self.difficulty_label}'.")
+
+    def _poll_chart_changes(self):
+        """
+        Watch mode: checks whether the chart was saved since the last poll and,
+        if so, hot-reloads it. Only changed lines are re-parsed and only newly
+        referenced WAVs are loaded (see Dtx.reload).
+
+        Returns:
+            bool: True if the timeline changed and must be swapped in.
+        """
+        now = time.perf_counter()
+        if now - self._last_watch_poll_s < self.WATCH_POLL_INTERVAL_S:
+            return False
+        self._last_watch_poll_s = now
+
+        try:
+            mtime = os.stat(self.dtx.dtx_path).st_mtime_ns
+        except OSError:
+            return False  # The editor may be replacing the file; try again later
+        if mtime == self._watched_mtime:
+            return False
+        self._watched_mtime = mtime
+
+        reload_start = time.perf_counter()
+        old_autoplay_chips = self.dtx.autoplay_chips
+        result = self.dtx.reload()
+        if result is None:
+            return False
+
+        if self.dtx.bgm_wav_id in result["wav_ids"]:
+            # Swapping the streamed BGM would interrupt playback
+            print("Note: BGM changes take effect after a restart.")
+        self.load_sounds(result["wav_ids"])
+
+        if self.dtx in self.stem_paths and self.dtx.autoplay_chips != old_autoplay_chips:
+            # Re-rendering would blow the reload budget; the stem stays as it was
+            print("Note: Autoplay stem changes take effect after a restart.")
+
+        if result["earliest_bar"] is not None or result["wav_ids"]:
+            # New notes or samples can raise the peak polyphony
+            self.fit_mixer_channels(grow_only=True)
+
+        # Keep the audio-driven clock aligned if the first BGM chip moved
+        _, new_bgm_offset_ms = self._bgm_source(self.dtx)
+        self.time_offset_ms += new_bgm_offset_ms - self.bgm_offset_ms
+        self.bgm_offset_ms = new_bgm_offset_ms
+
+        elapsed_ms = (time.perf_counter() - reload_start) * 1000
+        if result["earliest_bar"] is None:
+            print(f"Chart reloaded in {elapsed_ms:.1f} ms (resources only).")
+        else:
+            print(
+                f"Chart reloaded in {elapsed_ms:.1f} ms (re-timed from bar {result['earliest_bar']})."
+            )
+        return True
+
+    def _note_volume(self, wav_id):
+        """Final volume of a note: the master SE volume times the chart's #VOLUME."""
+        return self.se_volume * self.dtx.wav_volumes.get(wav_id, 100) / 100.0
+
+    def _start_session(self, current_time_ms):
+        """Starts judging (and recording) the current chart from `current_time_ms`."""
+        from dtx_judge import Judge, lane_note_times
+        from dtx_replay import ReplayRecorder
+
+        self.judge = Judge(lane_note_times(self.dtx.timed_notes))
+        self.recorder = None
+        if self.record_dir:
+            self.recorder = ReplayRecorder(self.dtx.dtx_path, self.record_dir)
+        self.last_judgment = None
+        if current_time_ms > 0:
+            self._seek_session(0.0, current_time_ms)
+
+    def _seek_session(self, from_ms, to_ms):
+        """Moves the judge to a new playhead position, recording the jump."""
+        self.judge.advance(from_ms)
+        self.judge.seek(to_ms)
+        if self.recorder:
+            self.recorder.seek(from_ms, to_ms)
+
+    def _end_session(self, end_ms):
+        """Finishes the current session: reports the score and saves the replay."""
+        from dtx_judge import JUDGMENT_NAMES
+
+        self.judge.advance(end_ms)
+        results = self.judge.results()
+        if self.judge.offset_count:
+            print(
+                f"Score ({self.difficulty_label or os.path.basename(self.dtx.dtx_path)}): "
+                + ", ".join(f"{name} {results[name]}" for name in JUDGMENT_NAMES)
+                + f", max combo {results['max_combo']}, "
+                f"mean offset {results['mean_offset_ms']:+.1f} ms."
+            )
+        if self.recorder:
+            replay_path = self.recorder.save(end_ms)
+            if replay_path:
+                print(f"Replay saved to '{replay_path}'.")
+
     def _draw_lane_indicators(self, screen):
         """Draws colored indicators for each lane below the judgment line."""
         indicator_y = self.JUDGMENT_LINE_Y + 5
@@ -557,33 +1032,173 @@ class Player:
                     text_rect = surface.get_rect(center=rect.center)
                     screen.blit(surface, text_rect)
 
+    def _draw_frame(self, screen, current_time_ms, notes_to_play, note_index, song_duration_ms):
+        """Renders the highway, BGA and status text and presents the frame."""
+        screen.fill(self.COLOR_BACKGROUND)
+
+        # BGA goes behind everything else
+        if self.bga:
+            self.bga.draw(screen, current_time_ms)
+
+        # Draw the highway and notes
+        self._draw_lanes_and_judgment_line(screen)
+        self._draw_lane_indicators(screen)
+        self._draw_notes(screen, current_time_ms, notes_to_play, note_index)
+        self._draw_hit_animations(screen, current_time_ms)
+
+        # --- Draw Progress Bar (DTXMania style on the right) ---
+        if song_duration_ms > 0:
+            progress_bar_x = (
+                self.NOTE_HIGHWAY_X_START + self.NOTE_HIGHWAY_WIDTH + 10
+            )
+            progress_bar_height = self.JUDGMENT_LINE_Y - self.NOTE_HIGHWAY_TOP_Y
+
+            # Background of the progress bar
+            bg_rect = pygame.Rect(
+                progress_bar_x,
+                self.NOTE_HIGHWAY_TOP_Y,
+                self.PROGRESS_BAR_WIDTH,
+                progress_bar_height,
+            )
+            pygame.draw.rect(screen, self.COLOR_LANE_SEPARATOR, bg_rect)
+
+            # Filled part of the progress bar (grows upwards)
+            progress = current_time_ms / song_duration_ms
+            fill_height = progress * progress_bar_height
+            fill_rect = pygame.Rect(
+                progress_bar_x,
+                self.JUDGMENT_LINE_Y - fill_height,
+                self.PROGRESS_BAR_WIDTH,
+                fill_height,
+            )
+
+            # Use a distinct color for the progress bar fill
+            progress_color = (180, 180, 40)  # A gold-like color
+            pygame.draw.rect(screen, progress_color, fill_rect)
+
+        info_texts = [
+            f"Time: {current_time_ms / 1000.0:.2f}s / {song_duration_ms / 1000.0:.2f}s",
+            f"Notes Played: {note_index} / {len(notes_to_play)}",
+            f"BPM: {self.dtx.bpm:.2f}",  # Note: This shows initial BPM only
+            f"BGM Volume: {self.bgm_volume * 100:.0f}% (Up/Down)",
+            f"SE Volume: {self.se_volume * 100:.0f}% (PgUp/PgDn)",
+            "Seek: Left/Right Arrows | Quit: ESC",
+        ]
+        if self.bga:
+            info_texts.append(
+                f"BGA: {len(self.bga.textures)} images, "
+                f"{self.bga.bytes_used / (1024 * 1024):.0f}/{self.bga_memory_mb} MB"
+            )
+        if self.song_set:
+            info_texts.append(
+                f"Difficulty: {self.difficulty_label} (1-{len(self.song_set.difficulties)})"
+            )
+        if self.last_judgment:
+            info_texts.append(f"{self.last_judgment}  Combo: {self.judge.combo}")
+        info_texts.append(self.pacer.status_text())
+        if self.engine:
+            stats = self.engine.stats()
+            info_texts.append(
+                f"Audio process: {stats['voices']} voices, "
+                f"worst trigger {stats['late_max_ms']:.1f} ms late"
+            )
+
+        for i, text in enumerate(info_texts):
+            surface = self.font.render(text, True, self.COLOR_TEXT)
+            screen.blit(surface, (10, 10 + i * 30))
+
+        pygame.display.flip()
+
+    def _frame_key(self, current_time_ms, notes_to_play, note_index):
+        """
+        Summarizes everything a frame would show. Returns None while
+        something moves (notes on the highway, hit flashes), so every frame
+        is drawn; otherwise a frame whose key equals the last drawn one can
+        be skipped. The clock text then only advances every IDLE_REDRAW_MS.
+        """
+        notes_on_highway = (
+            note_index < len(notes_to_play)
+            and notes_to_play[note_index][0] - current_time_ms <= self.SCROLL_TIME_MS
+        )
+        if notes_on_highway or self.hit_animations:
+            return None
+        return (
+            int(current_time_ms // self.IDLE_REDRAW_MS),
+            note_index,
+            self.bgm_volume,
+            self.se_volume,
+            self.last_judgment,
+            self.judge.combo,
+            self.difficulty_label,
+            self.bga.visible_state(current_time_ms) if self.bga else None,
+            self.engine.stats()["voices"] if self.engine else None,
+            self.pacer.fps,
+            round(self.pacer.cpu_load, 2),
+        )
+
     def play(self):
         """Starts the main playback loop."""
         if not self.sounds and not self.bgm_path:
             print("No sounds were loaded. Nothing to play.")
             return
+        from dtx_replay import quantize_ms
 
         notes_to_play = self.dtx.timed_notes[:]
         note_index = 0
         # The time offset is used to sync the chart's timeline with the
         # audio playback timeline. It's initialized with the BGM's start time.
-        self.time_offset_ms = self.dtx.bgm_start_time_ms
+        self.time_offset_ms = self.bgm_offset_ms
 
+        pygame.display.init()
+        pygame.font.init()
         screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
         pygame.display.set_caption(f"Playing: {self.dtx.title} - {self.dtx.artist}")
         self.font = pygame.font.Font(None, 28)
         self.small_font = pygame.font.Font(None, 24)
 
+        if self.bga_enabled and self.dtx.bga_events:
+            self.bga = BgaTextureCache(
+                self.dtx,
+                screen.get_rect(),
+                self.bga_memory_mb * 1024 * 1024,
+                self.BGA_BRIGHTNESS,
+            )
+            print(f"BGA enabled ({len(self.dtx.bga_events)} events).")
+
+        if self.sample_store:
+            from sample_store import DeferredSamples
+
+            charts = [chart for _, chart in self.song_set.difficulties] if self.song_set else [self.dtx]
+            self.deferred_samples = DeferredSamples(
+                self.sample_store, self.sounds, self.sound_cache, charts
+            )
+            self.deferred_samples.set_chart(self.dtx)
+            print(
+                self.sample_store.report(
+                    [p for w, p in self.dtx.wav_files.items() if w != self.dtx.bgm_wav_id],
+                    self.deferred_samples.deferred_paths(),
+                )
+            )
+
         # Calculate total song duration for progress bar
         song_duration_ms = 0
         if notes_to_play:
             song_duration_ms = notes_to_play[-1][0] + 3000  # Add 3s padding
 
-        clock = pygame.time.Clock()
+        self.pacer = FramePacer(
+            FramePacer.display_refresh_rate(), self.max_fps, self.cpu_budget
+        )
+        last_frame_key = None  # Frame key of the last frame drawn, see _frame_key
 
         print("\n--- Starting Playback ---")
         print("Press ESC to quit. Use Left/Right arrows to seek.")
         print("Use Up/Down for BGM volume. Use PageUp/PageDown for SE volume.")
+        print("Pads: A S D F G Space H J K L (L.Cym to Ride).")
+        if self.song_set:
+            print(f"Use 1-{len(self.song_set.difficulties)} to switch difficulty.")
+        if self.watch:
+            print("Watching the chart file for changes.")
+        print(self.pacer.describe())
 
         # --- Clock Initialization ---
         # The master clock is driven by the BGM audio position for perfect sync.
@@ -591,7 +1206,7 @@ class Player:
         clock_is_audio_driven = False
         if self.bgm_path:
             try:
-                pygame.mixer.music.play(fade_ms=self.bgm_fade_ms)
+                self.music.play(fade_ms=self.bgm_fade_ms)
                 clock_is_audio_driven = True
                 print("Playback clock is audio-driven (BGM position).")
             except pygame.error as e:
@@ -602,8 +1217,15 @@ class Player:
         if not clock_is_audio_driven:
             print("Playback clock is system-driven.")
 
-        start_ticks = pygame.time.get_ticks()
+        start_ticks = get_ticks_ms()
+        print(f"Playback started {(time.perf_counter() - LAUNCH_TIME_S) * 1000:.0f} ms after launch.")
+        first_note_reported = False
+        self._start_session(0.0)
+        send_index = 0  # Next note to hand to the audio process
+        frame_time_s = time.perf_counter()  # When current_time_ms was sampled
+        current_time_ms = 0.0
 
+        timeline_changed = False  # Set when a reload or difficulty switch replaces the chart
         running = True
         while running:
             for event in pygame.event.get():
@@ -614,15 +1236,16 @@ class Player:
 
                 # --- Volume and Seek functionality ---
                 if event.type == pygame.KEYDOWN:
+                    last_frame_key = None  # Whatever the key did, show it next frame
                     # BGM Volume control
                     if event.key == pygame.K_UP:
                         self.bgm_volume = min(1.0, self.bgm_volume + 0.1)
                         if self.bgm_path:
-                            pygame.mixer.music.set_volume(self.bgm_volume)
+                            self.music.set_volume(self.bgm_volume)
                     elif event.key == pygame.K_DOWN:
                         self.bgm_volume = max(0.0, self.bgm_volume - 0.1)
                         if self.bgm_path:
-                            pygame.mixer.music.set_volume(self.bgm_volume)
+                            self.music.set_volume(self.bgm_volume)
                     # SE Volume Control
                     elif event.key == pygame.K_PAGEUP:
                         self.se_volume = min(1.0, self.se_volume + 0.1)
@@ -630,12 +1253,29 @@ class Player:
                         self.se_volume = max(0.0, self.se_volume - 0.1)
 
                     # Get current time before calculating jump
-                    if clock_is_audio_driven and pygame.mixer.music.get_busy():
+                    if clock_is_audio_driven and self.music.get_busy():
                         current_time_ms = (
-                            pygame.mixer.music.get_pos() + self.time_offset_ms
+                            self.music.get_pos() + self.time_offset_ms
                         )
                     else:
-                        current_time_ms = pygame.time.get_ticks() - start_ticks
+                        current_time_ms = get_ticks_ms() - start_ticks
+
+                    # Pad hits are judged at the quantized time the replay will store
+                    if event.key in self.PAD_KEYS:
+                        hit_time_ms = quantize_ms(current_time_ms)
+                        lane = self.PAD_KEYS[event.key]
+                        judgment = self.judge.hit(hit_time_ms, lane)
+                        if judgment:
+                            self.last_judgment = judgment
+                        if self.recorder:
+                            self.recorder.hit(hit_time_ms, lane)
+
+                    # Difficulty switching for song sets (number keys 1-9)
+                    if self.song_set and pygame.K_1 <= event.key <= pygame.K_9:
+                        index = event.key - pygame.K_1
+                        if index < len(self.song_set.difficulties):
+                            self.switch_difficulty(index, current_time_ms)
+                            timeline_changed = True
 
                     new_time_ms = -1
 
@@ -650,21 +1290,23 @@ class Player:
                         if song_duration_ms > 0:
                             new_time_ms = min(new_time_ms, song_duration_ms)
 
+                        self._seek_session(quantize_ms(current_time_ms), quantize_ms(new_time_ms))
+
                         # Update the reference for the system clock fallback
-                        start_ticks = pygame.time.get_ticks() - new_time_ms
+                        start_ticks = get_ticks_ms() - new_time_ms
 
                         # Resync the BGM by restarting it at the new position
                         if clock_is_audio_driven:
                             # gentle fade-out before repositioning
-                            pygame.mixer.music.fadeout(self.bgm_fade_ms)
+                            self.music.fadeout(self.bgm_fade_ms)
                             self.time_offset_ms = new_time_ms
 
                             # Calculate the correct starting position within the BGM file
                             # by subtracting the initial BGM offset from the target chart time.
-                            music_start_pos_ms = new_time_ms - self.dtx.bgm_start_time_ms
+                            music_start_pos_ms = new_time_ms - self.bgm_offset_ms
                             music_start_pos_s = max(0, music_start_pos_ms / 1000.0)
 
-                            pygame.mixer.music.play(
+                            self.music.play(
                                 start=music_start_pos_s, fade_ms=self.bgm_fade_ms
                             )
 
@@ -678,25 +1320,71 @@ class Player:
                             note_index = len(notes_to_play)
 
                         # Stop all currently playing sounds when seeking
-                        pygame.mixer.stop()
-                        self.active_poly_sounds.clear()
-                        self.active_choke_sounds.clear()
+                        if self.engine:
+                            self.engine.stop_all()
+                            send_index = note_index
+                        else:
+                            self.voices.stop_all()
 
                         # Clear old hit animations
                         self.hit_animations.clear()
 
             # --- Update Master Clock ---
-            if clock_is_audio_driven and pygame.mixer.music.get_busy():
-                current_time_ms = pygame.mixer.music.get_pos() + self.time_offset_ms
+            frame_time_s = time.perf_counter()
+            if clock_is_audio_driven and self.music.get_busy():
+                current_time_ms = self.music.get_pos() + self.time_offset_ms
             else:
                 # If BGM ends or wasn't there, rely on the system clock
                 if clock_is_audio_driven:  # Just transitioned from audio to system
                     print("BGM finished. Switching to system clock.")
                     clock_is_audio_driven = False
-                    # Resync system clock to the BGM's last known position
-                    start_ticks = pygame.time.get_ticks() - song_duration_ms
-
-                current_time_ms = pygame.time.get_ticks() - start_ticks
+                    # Carry on from the BGM's last known position. A stem ends with
+                    # the last autoplay sample, which can be well before the last note.
+                    start_ticks = get_ticks_ms() - current_time_ms
+
+                current_time_ms = get_ticks_ms() - start_ticks
+
+            # --- Hot-reload of the edited chart ---
+            if self.watch and self._poll_chart_changes():
+                timeline_changed = True
+
+            # Swap in the new timeline at the current playhead
+            if timeline_changed:
+                timeline_changed = False
+                # The replaced chart's session ends here; a new one starts
+                self._end_session(quantize_ms(current_time_ms))
+                self._start_session(quantize_ms(current_time_ms))
+                if self.bga:
+                    self.bga.set_chart(self.dtx)
+                if self.deferred_samples:
+                    self.deferred_samples.set_chart(self.dtx)
+                notes_to_play = self.dtx.timed_notes[:]
+                note_index = bisect.bisect_left(notes_to_play, (current_time_ms,))
+                if self.engine:
+                    # Notes of the old timeline may already be scheduled
+                    self.engine.cancel_scheduled()
+                    send_index = note_index
+                song_duration_ms = 0
+                if notes_to_play:
+                    song_duration_ms = notes_to_play[-1][0] + 3000  # Add 3s padding
+
+            # The audio process gets notes ahead of time and fires them on its
+            # own clock, so a slow frame here cannot delay them
+            if self.engine:
+                while (
+                    send_index < len(notes_to_play)
+                    and notes_to_play[send_index][0]
+                    <= current_time_ms + self.ENGINE_LOOKAHEAD_MS
+                ):
+                    note_time_ms, channel_id, wav_id = notes_to_play[send_index]
+                    if wav_id in self.sounds:
+                        self.engine.trigger(
+                            frame_time_s + (note_time_ms - current_time_ms) / 1000.0,
+                            channel_id,
+                            self.sounds[wav_id],
+                            self._note_volume(wav_id),
+                        )
+                    send_index += 1
 
             # Trigger notes that are due
             while (
@@ -704,157 +1392,357 @@ class Player:
                 and notes_to_play[note_index][0] <= current_time_ms
             ):
                 _, channel_id, wav_id = notes_to_play[note_index]
+                if self.deferred_samples and wav_id not in self.sounds:
+                    # Its prefetch has not landed yet, e.g. right after a seek
+                    self.deferred_samples.load_now(wav_id)
                 if wav_id in self.sounds:
-                    sound_to_play = self.sounds[wav_id]
-
-                    # 1. --- Choke Logic ---
-                    # If this note is a "choker", stop any corresponding "choked" sounds.
-                    if channel_id in self.CHOKE_MAP:
-                        for choked_channel_id in self.CHOKE_MAP[channel_id]:
-                            if choked_channel_id in self.active_choke_sounds:
-                                channel_to_stop = self.active_choke_sounds[
-                                    choked_channel_id
-                                ]
-                                if channel_to_stop and channel_to_stop.get_busy():
-                                    channel_to_stop.fadeout(self.se_fade_out_ms)
-                                # Remove it from tracking since it's now choked
-                                del self.active_choke_sounds[choked_channel_id]
-
-                    # 2. --- Polyphony & Playback Logic ---
-                    # This logic now operates per channel, not per sound file.
-                    # Initialize a list for this channel if it's the first time we've seen it.
-                    if channel_id not in self.active_poly_sounds:
-                        self.active_poly_sounds[channel_id] = []
-
-                    # Get the list of currently playing instances for this specific channel.
-                    playing_instances = self.active_poly_sounds[channel_id]
-
-                    # Clean up any sounds in the list that have finished playing naturally.
-                    playing_instances = [
-                        item for item in playing_instances if item[0].get_busy()
-                    ]
-
-                    # Voice stealing: If we're at the polyphony limit, stop the oldest sound.
-                    if len(playing_instances) >= self.POLYPHONY_LIMIT:
-                        # Sort by play time to find the oldest sound.
-                        playing_instances.sort(key=lambda x: x[1])
-                        # Get the channel of the oldest sound and remove it from our tracking list.
-                        oldest_channel, _ = playing_instances.pop(0)
-                        # Fade it out to free up a mixer channel.
-                        oldest_channel.fadeout(self.se_fade_out_ms)
-
-                    # Play the new sound with a gentle fade-in.
-                    # The final volume combines the master SE volume and the per-WAV volume from the chart.
-                    wav_vol_percent = self.dtx.wav_volumes.get(wav_id, 100)
-                    note_vol_multiplier = wav_vol_percent / 100.0
-                    final_volume = self.se_volume * note_vol_multiplier
-
-                    # Set the volume on the Sound object itself right before playing.
-                    # This ensures the fade-in targets the correct final volume.
-                    sound_to_play.set_volume(final_volume)
-                    new_channel = sound_to_play.play(fade_ms=self.se_fade_in_ms)
-
-                    if new_channel:
-                        # The volume is now set on the Sound, so this is no longer needed.
-                        # new_channel.set_volume(final_volume)
-
-                        # Add the new sound to our polyphony tracking list.
-                        playing_instances.append((new_channel, current_time_ms))
-
-                        # If this sound is one that can BE choked (e.g., an open hi-hat),
-                        # track its channel so a future "choker" can stop it.
-                        if channel_id in self.CHOKEABLE_CHANNELS:
-                            self.active_choke_sounds[channel_id] = new_channel
-
-                    # Update the master list of active sounds.
-                    self.active_poly_sounds[channel_id] = playing_instances
+                    if not self.engine:
+                        self.voices.play(
+                            channel_id,
+                            self.sounds[wav_id],
+                            self._note_volume(wav_id),
+                            current_time_ms,
+                        )
 
                     # Add an animation for visual feedback
                     self.hit_animations.append(
                         {"channel_id": channel_id, "time": current_time_ms}
                     )
+
+                    if not first_note_reported:
+                        first_note_reported = True
+                        print(
+                            f"Time to first note: {(time.perf_counter() - LAUNCH_TIME_S) * 1000:.0f} ms "
+                            f"(chart time {current_time_ms / 1000.0:.2f}s)."
+                        )
                 note_index += 1
 
+            self.judge.advance(quantize_ms(current_time_ms))
+
             # Check if playback is finished
-            bgm_playing = pygame.mixer.music.get_busy()
+            bgm_playing = self.music.get_busy()
             if note_index >= len(notes_to_play) and not bgm_playing:
                 print("Playback finished.")
                 time.sleep(2)
                 running = False
 
-            # --- Render status to the screen ---
-            screen.fill(self.COLOR_BACKGROUND)
+            # --- Present a frame (at the display rate, only if something changed) ---
+            if self.pacer.frame_due(frame_time_s):
+                if self.bga:
+                    self.bga.update(current_time_ms)
+                if self.deferred_samples:
+                    self.deferred_samples.update(current_time_ms)
+                frame_key = self._frame_key(current_time_ms, notes_to_play, note_index)
+                if frame_key is None or frame_key != last_frame_key:
+                    draw_start_s = time.perf_counter()
+                    self._draw_frame(
+                        screen, current_time_ms, notes_to_play, note_index, song_duration_ms
+                    )
+                    self.pacer.frame_drawn(time.perf_counter() - draw_start_s)
+                else:
+                    self.pacer.frame_skipped()
+                last_frame_key = frame_key
+
+            # Sleep until the next tick, frame or note, whichever comes first
+            next_due_s = float("inf")
+            if not self.engine and note_index < len(notes_to_play):
+                next_due_s = frame_time_s + (notes_to_play[note_index][0] - current_time_ms) / 1000.0
+            self.pacer.sleep(next_due_s)
+
+        self._end_session(quantize_ms(current_time_ms))
+        print(self.pacer.report())
+        if self.bga:
+            self.bga.shutdown()
+        if self.deferred_samples:
+            self.deferred_samples.shutdown()
+        if self.engine:
+            self.engine.shutdown()
+        pygame.quit()
+        print("Player has shut down.")
 
-            # Draw the highway and notes
-            self._draw_lanes_and_judgment_line(screen)
-            self._draw_lane_indicators(screen)
-            self._draw_notes(screen, current_time_ms, notes_to_play, note_index)
-            self._draw_hit_animations(screen, current_time_ms)
 
-            # --- Draw Progress Bar (DTXMania style on the right) ---
-            if song_duration_ms > 0:
-                progress_bar_x = (
-                    self.NOTE_HIGHWAY_X_START + self.NOTE_HIGHWAY_WIDTH + 10
-                )
-                progress_bar_height = self.JUDGMENT_LINE_Y - self.NOTE_HIGHWAY_TOP_Y
-
-                # Background of the progress bar
-                bg_rect = pygame.Rect(
-                    progress_bar_x,
-                    self.NOTE_HIGHWAY_TOP_Y,
-                    self.PROGRESS_BAR_WIDTH,
-                    progress_bar_height,
-                )
-                pygame.draw.rect(screen, self.COLOR_LANE_SEPARATOR, bg_rect)
-
-                # Filled part of the progress bar (grows upwards)
-                progress = current_time_ms / song_duration_ms
-                fill_height = progress * progress_bar_height
-                fill_rect = pygame.Rect(
-                    progress_bar_x,
-                    self.JUDGMENT_LINE_Y - fill_height,
-                    self.PROGRESS_BAR_WIDTH,
-                    fill_height,
-                )
+class LoadingScreen:
+    """A minimal loading screen shown while the startup pipeline runs."""
 
-                # Use a distinct color for the progress bar fill
-                progress_color = (180, 180, 40)  # A gold-like color
-                pygame.draw.rect(screen, progress_color, fill_rect)
+    FRAME_TIME_S = 1 / 60  # How often the screen is redrawn while waiting
 
-            info_texts = [
-                f"Time: {current_time_ms / 1000.0:.2f}s / {song_duration_ms / 1000.0:.2f}s",
-                f"Notes Played: {note_index} / {len(notes_to_play)}",
-                f"BPM: {self.dtx.bpm:.2f}",  # Note: This shows initial BPM only
-                f"BGM Volume: {self.bgm_volume * 100:.0f}% (Up/Down)",
-                f"SE Volume: {self.se_volume * 100:.0f}% (PgUp/PgDn)",
-                "Seek: Left/Right Arrows | Quit: ESC",
-            ]
+    def __init__(self):
+        # Only the subsystems the loading screen needs; audio comes separately.
+        pygame.display.init()
+        pygame.font.init()
+        self.screen = pygame.display.set_mode((Player.SCREEN_WIDTH, Player.SCREEN_HEIGHT))
+        pygame.display.set_caption("Loading...")
+        self.font = pygame.font.Font(None, 28)
+        self.draw("Starting...")
+
+    def draw(self, status, progress=None):
+        """Draws the status line and an optional progress bar (0.0-1.0)."""
+        # Keep the window responsive; input is ignored until playback.
+        pygame.event.pump()
+        self.screen.fill(Player.COLOR_BACKGROUND)
+        surface = self.font.render(status, True, Player.COLOR_TEXT)
+        self.screen.blit(surface, surface.get_rect(center=self.screen.get_rect().center))
+        if progress is not None:
+            bar = pygame.Rect(0, 0, Player.SCREEN_WIDTH // 2, 10)
+            bar.midtop = (Player.SCREEN_WIDTH // 2, Player.SCREEN_HEIGHT // 2 + 30)
+            pygame.draw.rect(self.screen, Player.COLOR_LANE_SEPARATOR, bar)
+            bar.width = int(bar.width * progress)
+            pygame.draw.rect(self.screen, (180, 180, 40), bar)
+        pygame.display.flip()
+
+    def open_audio(self, latency_mode=None):
+        """
+        Opens the audio device (see Player.init_audio) while the screen keeps
+        redrawing. The first launch on a machine probes the device first
+        (see audio_settings), which takes seconds.
+        """
+        if pygame.mixer.get_init():
+            return
+        from audio_tuning import DEFAULT_LATENCY_MODE, audio_settings
+
+        latency_mode = latency_mode or DEFAULT_LATENCY_MODE
+        with ThreadPoolExecutor(max_workers=1) as probe_pool:
+            settings_future = probe_pool.submit(audio_settings, latency_mode)
+            while not settings_future.done():
+                self.draw("Probing audio device...")
+                time.sleep(self.FRAME_TIME_S)
+        Player.init_audio(latency_mode, settings_future.result())
+
+    def wait(self, futures, status):
+        """Redraws the screen with a progress bar until all futures are done."""
+        futures = list(futures)
+        while True:
+            done = sum(1 for f in futures if f.done())
+            self.draw(f"{status} ({done}/{len(futures)})", done / len(futures) if futures else 1.0)
+            if done == len(futures):
+                return
+            time.sleep(self.FRAME_TIME_S)
+
+
+def run_startup_pipeline(
+    path,
+    difficulty=1,
+    decode_workers=4,
+    audio_process=False,
+    compact_samples=False,
+    latency_mode=None,
+    **player_options,
+):
+    """
+    Starts the player with the slow startup steps overlapped instead of run
+    one after another:
+
+    - the chart is parsed on a background thread while the window, the
+      loading screen and the audio device are brought up;
+    - samples start decoding on a thread pool as soon as the parser knows
+      the WAV definitions, while it is still timing the chart (pygame
+      decodes without holding the GIL).
+
+    Reports how long each stage took, measured from launch.
+
+    Args:
+        path (str): Chart, set.def or song folder, see open_chart.
+        difficulty (int): Starting difficulty for song sets.
+        decode_workers (int): Threads used to decode samples.
+        audio_process (bool): Run the mixer in a separate process (see
+            AudioEngine); samples are then decoded there.
+        compact_samples (bool): Trim and cache samples through a
+            SampleStore (needs NumPy; not available with audio_process).
+        latency_mode (str, optional): See Player.init_audio.
+        **player_options: Passed on to Player.
+
+    Returns:
+        Player | None: The ready-to-play player, or None if nothing could be loaded.
+    """
+    def elapsed_ms():
+        return (time.perf_counter() - LAUNCH_TIME_S) * 1000
+
+    stage_times = {}
+    decode_pool = ThreadPoolExecutor(max_workers=decode_workers)
+    decodes = {}  # Maps sample path to its decode Future
+    resources = []  # Charts whose WAV definitions are known, filled by the parser thread
+    engine = None
+    sample_store = None
+    if compact_samples and audio_process:
+        print("Warning: Compact samples are not supported with --audio-process; ignoring.")
+    elif compact_samples:
+        try:
+            from sample_store import SampleStore
+
+            sample_store = SampleStore()
+        except ImportError:
+            print("Warning: Compact samples need NumPy; loading samples as they are.")
+
+    def submit_decodes(dtx_data):
+        for wav_id, sample_path in dtx_data.wav_files.items():
+            if wav_id == dtx_data.bgm_wav_id or sample_path in decodes:
+                continue  # BGM is streamed, not decoded
+            if not os.path.exists(sample_path):
+                continue
+            if engine:
+                decodes[sample_path] = engine.load_sample(sample_path)
+            elif sample_store:
+                decodes[sample_path] = decode_pool.submit(sample_store.load, sample_path)
+            else:
+                decodes[sample_path] = decode_pool.submit(pygame.mixer.Sound, sample_path)
 
-            for i, text in enumerate(info_texts):
-                surface = self.font.render(text, True, self.COLOR_TEXT)
-                screen.blit(surface, (10, 10 + i * 30))
+    with ThreadPoolExecutor(max_workers=1) as parse_pool:
+        parse_future = parse_pool.submit(open_chart, path, difficulty, resources.append)
 
-            pygame.display.flip()
-            clock.tick(240)  # Use a high tick rate for accurate timing
+        loading = LoadingScreen()
+        stage_times["window"] = elapsed_ms()
+        if audio_process:
+            from audio_engine import AudioEngine
 
-        pygame.quit()
-        print("Player has shut down.")
+            engine = AudioEngine(
+                functools.partial(Player.init_audio, latency_mode), decode_workers
+            )
+            stage_times["audio process started"] = elapsed_ms()
+        else:
+            loading.open_audio(latency_mode)
+            stage_times["audio device"] = elapsed_ms()
+
+        # Start decoding as soon as the WAV definitions are in
+        while not resources and not parse_future.done():
+            loading.draw("Reading chart...")
+            time.sleep(LoadingScreen.FRAME_TIME_S)
+        if resources:
+            submit_decodes(resources[0])
+
+        while not parse_future.done():
+            loading.draw("Timing chart...")
+            time.sleep(LoadingScreen.FRAME_TIME_S)
+        dtx_data, song_set = parse_future.result()
+        stage_times["chart parsed"] = elapsed_ms()
+
+    if dtx_data is None:
+        decode_pool.shutdown(cancel_futures=True)
+        if engine:
+            engine.shutdown()
+        return None
+
+    # Song sets are parsed as a whole; decode the samples of every difficulty.
+    for _, chart in song_set.difficulties if song_set else [(None, dtx_data)]:
+        submit_decodes(chart)
+
+    if engine:
+        # The audio process may still be probing the device (see audio_settings)
+        loading.wait([engine.ready], "Starting audio")
+    loading.wait(decodes.values(), "Decoding samples")
+    decode_pool.shutdown()
+    stage_times["samples decoded"] = elapsed_ms()
+
+    player = Player(
+        dtx_data, song_set=song_set, engine=engine, sample_store=sample_store, **player_options
+    )
+    for sample_path, future in decodes.items():
+        if future.exception() is None:
+            player.sound_cache[sample_path] = future.result()
+
+    if player.use_stems:
+        charts = [chart for _, chart in song_set.difficulties] if song_set else [dtx_data]
+        with ThreadPoolExecutor(max_workers=1) as stem_pool:
+            loading.wait([stem_pool.submit(player.prepare_stems, charts)], "Rendering autoplay stems")
+        stage_times["stems rendered"] = elapsed_ms()
+    # Failed decodes are retried here, which also reports them.
+    player.load_sounds()
+    stage_times["ready"] = elapsed_ms()
+
+    print(
+        "Startup: "
+        + ", ".join(f"{stage} at {ms:.0f} ms" for stage, ms in stage_times.items())
+        + "."
+    )
+    return player
 
 
 def main():
     """Main function to run the DTX player from the command line."""
-    if len(sys.argv) < 2:
-        print("Usage: python dtx_player.py <path_to_dtx_file>")
-        sys.exit(1)
-
-    dtx_file_path = sys.argv[1]
+    from dtx_replay import DEFAULT_REPLAY_DIR
+    from audio_tuning import DEFAULT_LATENCY_MODE, LATENCY_MODES
+
+    parser = argparse.ArgumentParser(description="Play a DTX drum chart.")
+    parser.add_argument(
+        "dtx_file",
+        help="path to the .dtx file, or to a set.def / song folder to load every difficulty",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="reload the chart whenever it is saved, without restarting playback",
+    )
+    parser.add_argument(
+        "--difficulty",
+        type=int,
+        default=1,
+        help="difficulty to start with when playing a song set (1 = first listed)",
+    )
+    parser.add_argument("--no-bga", action="store_true", help="don't show BGA/BGI images")
+    parser.add_argument(
+        "--bga-memory-mb",
+        type=int,
+        help=f"memory cap for decoded BGA images (default: {Player.BGA_MEMORY_LIMIT_MB})",
+    )
+    parser.add_argument(
+        "--stems",
+        action="store_true",
+        help="pre-mix all BGM/SE autoplay chips into one stem (needs NumPy)",
+    )
+    parser.add_argument(
+        "--record",
+        nargs="?",
+        const=DEFAULT_REPLAY_DIR,
+        metavar="DIR",
+        help=f"save pad input as replays (default directory: {DEFAULT_REPLAY_DIR})",
+    )
+    parser.add_argument(
+        "--audio-process",
+        action="store_true",
+        help="run audio in a separate process so drawing cannot delay it",
+    )
+    parser.add_argument(
+        "--max-fps",
+        type=int,
+        help="cap the frame rate (default: the display refresh rate)",
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        type=float,
+        metavar="PERCENT",
+        help="lower the frame rate as needed to stay under this share of one CPU core",
+    )
+    parser.add_argument(
+        "--compact-samples",
+        action="store_true",
+        help="trim silent sample tails, cache the results and load rarely used "
+        "long samples only when needed (needs NumPy)",
+    )
+    parser.add_argument(
+        "--latency",
+        choices=LATENCY_MODES,
+        default=DEFAULT_LATENCY_MODE,
+        help="audio buffer size: 'low' uses the smallest the device handled in a probe, "
+        "'auto' one size larger, 'safe' the fixed 1024 frames (default: %(default)s)",
+    )
+    args = parser.parse_args()
 
     try:
-        dtx_data = Dtx(dtx_file_path)
-        dtx_data.parse()
-
-        player = Player(dtx_data)
-        player.load_sounds()
+        player = run_startup_pipeline(
+            args.dtx_file,
+            args.difficulty,
+            watch=args.watch,
+            bga=not args.no_bga,
+            bga_memory_mb=args.bga_memory_mb,
+            stems=args.stems,
+            record_dir=args.record,
+            audio_process=args.audio_process,
+            max_fps=args.max_fps,
+            cpu_budget=args.cpu_budget / 100.0 if args.cpu_budget else None,
+            compact_samples=args.compact_samples,
+            latency_mode=args.latency,
+        )
+        if player is None:
+            sys.exit(1)
         player.play()
 
     except Exception as e:
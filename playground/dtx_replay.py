@@ -0,0 +1,339 @@
+import os
+import sys
+import csv
+import time
+import struct
+import hashlib
+import argparse
+
+from dtx_parser import Dtx
+from dtx_judge import Judge, JUDGMENT_WINDOWS_MS, lane_note_times
+
+
+# --- Replay file format ---
+# Header: magic, format version, SHA-1 of the chart file, recording start
+# (Unix time) and the number of events. It is followed by one varint per
+# event: the zigzag-encoded time delta to the previous event in ticks,
+# shifted left by LANE_BITS, with the lane code in the low bits. Lane codes
+# are lane indices (see LANE_DEFINITIONS) plus two control codes:
+#   SEEK_CODE: the player jumped; a second varint holds the zigzag-encoded
+#              jump distance in ticks, and later deltas count from the target.
+#   END_CODE:  the session ended at this time.
+# A typical hit costs two bytes.
+REPLAY_MAGIC = b"DTXR"
+REPLAY_FORMAT_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sB20sdI")
+REPLAY_EXTENSION = ".dtxr"
+TICKS_PER_MS = 10  # Event times are stored with 0.1 ms resolution
+LANE_BITS = 4
+END_CODE = 14
+SEEK_CODE = 15
+
+DEFAULT_REPLAY_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "patazon", "replays")
+
+
+def chart_file_hash(dtx_path):
+    """Returns the SHA-1 digest of a chart file; replays are keyed by it."""
+    with open(dtx_path, "rb") as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def quantize_ms(time_ms):
+    """
+    Rounds a time to the replay tick resolution. The player judges quantized
+    times so a replayed session scores exactly like the live one.
+    """
+    return round(time_ms * TICKS_PER_MS) / TICKS_PER_MS
+
+
+def _append_varint(buffer, value):
+    """Appends a zigzag-encoded signed integer as a LEB128 varint."""
+    value = (value << 1) ^ (value >> 63)
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, pos):
+    """Reads a zigzag-encoded varint. Returns (value, next position)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), pos
+
+
+class ReplayRecorder:
+    """Collects the pad events of one play session of one chart."""
+
+    def __init__(self, dtx_path, replay_dir=DEFAULT_REPLAY_DIR):
+        self.dtx_path = dtx_path
+        self.replay_dir = replay_dir
+        self.chart_hash = chart_file_hash(dtx_path)
+        self.started_at = time.time()
+        self.events = bytearray()
+        self.event_count = 0
+        self.hit_count = 0
+        self._last_ticks = 0
+
+    def _append(self, time_ms, code):
+        ticks = round(time_ms * TICKS_PER_MS)
+        _append_varint(self.events, ((ticks - self._last_ticks) << LANE_BITS) | code)
+        self._last_ticks = ticks
+        self.event_count += 1
+
+    def hit(self, time_ms, lane):
+        """Records a pad hit at chart time `time_ms` on a lane index."""
+        self._append(time_ms, lane)
+        self.hit_count += 1
+
+    def seek(self, from_ms, to_ms):
+        """Records a jump of the playhead."""
+        self._append(from_ms, SEEK_CODE)
+        target_ticks = round(to_ms * TICKS_PER_MS)
+        _append_varint(self.events, target_ticks - self._last_ticks)
+        self._last_ticks = target_ticks
+
+    def save(self, end_ms):
+        """
+        Ends the session and writes it to the replay directory. Sessions
+        without a single hit are not saved.
+
+        Returns:
+            str | None: Path of the written replay.
+        """
+        if not self.hit_count:
+            return None
+        self._append(end_ms, END_CODE)
+
+        os.makedirs(self.replay_dir, exist_ok=True)
+        name = (
+            f"{self.chart_hash.hex()[:12]}-"
+            f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}"
+            f"-{int(self.started_at * 1000) % 1000:03d}{REPLAY_EXTENSION}"
+        )
+        path = os.path.join(self.replay_dir, name)
+        header = REPLAY_HEADER.pack(
+            REPLAY_MAGIC, REPLAY_FORMAT_VERSION, self.chart_hash, self.started_at, self.event_count
+        )
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(self.events)
+        return path
+
+
+def read_replay_header(path):
+    """
+    Returns:
+        tuple: (chart hash as hex, recording start as Unix time, event count).
+
+    Raises:
+        ValueError: If the file is not a replay this version can read.
+    """
+    with open(path, "rb") as f:
+        header = f.read(REPLAY_HEADER.size)
+    if len(header) < REPLAY_HEADER.size:
+        raise ValueError("truncated header")
+    magic, version, chart_hash, started_at, event_count = REPLAY_HEADER.unpack(header)
+    if magic != REPLAY_MAGIC or version != REPLAY_FORMAT_VERSION:
+        raise ValueError("not a replay file, or an unsupported version")
+    return chart_hash.hex(), started_at, event_count
+
+
+def read_replay(path):
+    """
+    Decodes a replay.
+
+    Returns:
+        list[tuple]: Events as (time_ms, code, seek_target_ms or None).
+    """
+    _, _, event_count = read_replay_header(path)
+    with open(path, "rb") as f:
+        data = f.read()[REPLAY_HEADER.size :]
+
+    events = []
+    pos = 0
+    ticks = 0
+    lane_mask = (1 << LANE_BITS) - 1
+    for _ in range(event_count):
+        value, pos = _read_varint(data, pos)
+        ticks += value >> LANE_BITS
+        code = value & lane_mask
+        if code == SEEK_CODE:
+            jump, pos = _read_varint(data, pos)
+            events.append((ticks / TICKS_PER_MS, code, (ticks + jump) / TICKS_PER_MS))
+            ticks += jump
+        else:
+            events.append((ticks / TICKS_PER_MS, code, None))
+    return events
+
+
+def replay_session(lane_times, events, windows=JUDGMENT_WINDOWS_MS):
+    """
+    Feeds a recorded session through the judgment path, as fast as it goes.
+
+    Args:
+        lane_times (list[list[float]]): From lane_note_times().
+        events (list[tuple]): From read_replay().
+        windows (tuple): Judgment windows to score with.
+
+    Returns:
+        dict: See Judge.results().
+    """
+    judge = Judge(lane_times, windows)
+    for time_ms, code, seek_target_ms in events:
+        if code == SEEK_CODE:
+            judge.advance(time_ms)
+            judge.seek(seek_target_ms)
+        elif code == END_CODE:
+            judge.advance(time_ms)
+        else:
+            judge.hit(time_ms, code)
+    return judge.results()
+
+
+def _rescore_chart(args):
+    """Worker: parses one chart once and re-scores a batch of its sessions."""
+    dtx_path, replay_paths, windows = args
+    try:
+        dtx = Dtx(dtx_path)
+        dtx.parse(verbose=False)
+        lane_times = lane_note_times(dtx.timed_notes)
+    except Exception as e:
+        print(f"Warning: Could not parse '{dtx_path}'. Error: {e}")
+        return []
+
+    results = []
+    for replay_path in replay_paths:
+        try:
+            result = replay_session(lane_times, read_replay(replay_path), windows)
+        except (OSError, ValueError, IndexError) as e:
+            print(f"Warning: Could not read replay '{replay_path}'. Error: {e}")
+            continue
+        result["replay"] = replay_path
+        result["chart"] = dtx_path
+        results.append(result)
+    return results
+
+
+def rescore_replays(chart_paths, replay_paths, windows=JUDGMENT_WINDOWS_MS, jobs=None, batch_size=256):
+    """
+    Re-scores recorded sessions across a process pool. Sessions are grouped
+    by chart so each worker parses a chart once per batch.
+
+    Args:
+        chart_paths (list[str]): Charts the replays may refer to.
+        replay_paths (list[str]): Replay files.
+        windows (tuple): Judgment windows to score with.
+        jobs (int, optional): Worker processes; defaults to the CPU count.
+        batch_size (int): Sessions per work item.
+
+    Returns:
+        tuple: (list of result dicts, number of replays whose chart was not found).
+    """
+    charts_by_hash = {}
+    for path in chart_paths:
+        charts_by_hash.setdefault(chart_file_hash(path).hex(), path)
+
+    sessions_by_chart = {}
+    unmatched = 0
+    for replay_path in replay_paths:
+        try:
+            chart_hash, _, _ = read_replay_header(replay_path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Skipping '{replay_path}'. Error: {e}")
+            continue
+        if chart_hash not in charts_by_hash:
+            unmatched += 1
+            continue
+        sessions_by_chart.setdefault(charts_by_hash[chart_hash], []).append(replay_path)
+
+    tasks = [
+        (dtx_path, sessions[i : i + batch_size], windows)
+        for dtx_path, sessions in sessions_by_chart.items()
+        for i in range(0, len(sessions), batch_size)
+    ]
+    # Imported here: the player imports this module while starting up
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = [r for batch in pool.map(_rescore_chart, tasks) for r in batch]
+    return results, unmatched
+
+
+def _find_files(directory, extensions):
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(extensions):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def main():
+    """Command-line entry point: re-score recorded sessions headlessly."""
+    parser = argparse.ArgumentParser(description="Re-score recorded DTX play sessions.")
+    parser.add_argument("library", help="directory to scan for the charts the replays refer to")
+    parser.add_argument(
+        "replays",
+        nargs="?",
+        default=DEFAULT_REPLAY_DIR,
+        help=f"directory of {REPLAY_EXTENSION} files (default: {DEFAULT_REPLAY_DIR})",
+    )
+    parser.add_argument(
+        "--windows",
+        help="judgment windows in ms as PERFECT,GREAT,GOOD,POOR (default: "
+        + ",".join(f"{ms:g}" for _, ms in JUDGMENT_WINDOWS_MS)
+        + ")",
+    )
+    parser.add_argument("-o", "--output", help="CSV file for per-session results")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    windows = JUDGMENT_WINDOWS_MS
+    if args.windows:
+        try:
+            values = [float(v) for v in args.windows.split(",")]
+        except ValueError:
+            values = []
+        if len(values) != len(JUDGMENT_WINDOWS_MS) or values != sorted(values):
+            print("Error: --windows needs four increasing values, e.g. 34,67,84,117.")
+            sys.exit(1)
+        windows = tuple((name, ms) for (name, _), ms in zip(JUDGMENT_WINDOWS_MS, values))
+
+    replay_paths = _find_files(args.replays, (REPLAY_EXTENSION,))
+    print(f"Re-scoring {len(replay_paths)} sessions...")
+    start = time.perf_counter()
+    results, unmatched = rescore_replays(
+        _find_files(args.library, (".dtx",)), replay_paths, windows, args.jobs
+    )
+    elapsed_s = time.perf_counter() - start
+    if unmatched:
+        print(f"Warning: {unmatched} sessions refer to charts not found in '{args.library}'.")
+
+    judgment_names = [name for name, _ in windows] + ["MISS"]
+    totals = {name: sum(r[name] for r in results) for name in judgment_names}
+    total_notes = sum(totals.values()) or 1
+    print(f"Re-scored {len(results)} sessions in {elapsed_s:.1f}s.")
+    print(
+        "  "
+        + ", ".join(f"{name} {totals[name] / total_notes * 100:.1f}%" for name in judgment_names)
+    )
+
+    if args.output:
+        columns = ["replay", "chart"] + judgment_names + ["max_combo", "mean_offset_ms", "stdev_offset_ms"]
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Wrote per-session results to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import os
+import json
+import bisect
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame
+
+from cache_files import CACHE_ROOT, temp_path, write_wav_atomic
+
+
+# Bump when the processing changes so stale cached samples are not reused.
+SAMPLE_CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(CACHE_ROOT, "samples")
+
+TRIM_THRESHOLD_DB = -60.0  # Tail below this level (relative to full scale) is cut
+TAIL_FADE_MS = 5  # Fade-out applied where the tail is cut, so the cut never clicks
+MONO_TOLERANCE = 16  # Largest L/R difference (16-bit steps) still treated as mono
+
+
+class SampleStore:
+    """
+    Optional storage policy for drum samples, applied once per sample file:
+
+    - silent tails (below TRIM_THRESHOLD_DB until the end) are cut off;
+    - samples whose channels are identical are stored as mono.
+
+    The processed sample is written to a cache as a WAV file, together with
+    its analysis, so later loads skip decoding the original. pygame keeps
+    every loaded Sound in the mixer format, so a mono sample still becomes
+    stereo once loaded; mono storage shrinks the cache and the load, while
+    trimming shrinks resident memory as well.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.info = {}  # Maps original sample path to its analysis (see process())
+        self._lock = threading.Lock()
+
+    def _cache_key(self, path, mixer_format):
+        stat = os.stat(path)
+        digest = hashlib.sha1(
+            f"v{SAMPLE_CACHE_VERSION} {TRIM_THRESHOLD_DB} {mixer_format} "
+            f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+        )
+        return digest.hexdigest()
+
+    def process(self, path):
+        """
+        Analyses a sample and stores the processed version in the cache, or
+        fetches it from there. Safe to call from worker threads.
+
+        Returns:
+            dict: 'path' (processed WAV), 'mono', 'length_s', 'original_bytes'
+            (memory the untouched Sound takes) and 'resident_bytes' (memory
+            the processed Sound takes).
+        """
+        with self._lock:
+            if path in self.info:
+                return self.info[path]
+
+        frequency, _, channels = pygame.mixer.get_init()
+        key = self._cache_key(path, (frequency, channels))
+        wav_path = os.path.join(self.cache_dir, key + ".wav")
+        meta_path = os.path.join(self.cache_dir, key + ".json")
+
+        info = None
+        if os.path.exists(wav_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                info = None
+        if info is None:
+            info = self._render(path, wav_path, meta_path, frequency, channels)
+
+        with self._lock:
+            self.info[path] = info
+        return info
+
+    def _render(self, path, wav_path, meta_path, frequency, channels):
+        pcm = pygame.sndarray.array(pygame.mixer.Sound(path))
+        if pcm.ndim == 1:
+            pcm = pcm[:, np.newaxis]
+        original_frames = len(pcm)
+
+        # Cut the tail after the last frame above the threshold, keeping a short fade
+        threshold = np.iinfo(np.int16).max * 10 ** (TRIM_THRESHOLD_DB / 20)
+        loud = np.flatnonzero(np.abs(pcm).max(axis=1) > threshold)
+        fade_frames = frequency * TAIL_FADE_MS // 1000
+        end = min(original_frames, int(loud[-1]) + 1 + fade_frames) if loud.size else 0
+        pcm = pcm[:end].astype(np.float32)
+        fade = min(fade_frames, end)
+        if fade:
+            pcm[end - fade :] *= np.linspace(1.0, 0.0, fade, dtype=np.float32)[:, np.newaxis]
+
+        mono = pcm.shape[1] > 1 and (
+            pcm.size == 0 or np.abs(pcm - pcm[:, :1]).max() <= MONO_TOLERANCE
+        )
+        if mono:
+            pcm = pcm[:, :1]
+        pcm_out = np.round(pcm).astype("<i2")
+
+        write_wav_atomic(wav_path, pcm_out, frequency)
+
+        info = {
+            "path": wav_path,
+            "mono": bool(mono),
+            "length_s": end / frequency,
+            "original_bytes": original_frames * channels * 2,
+            "resident_bytes": end * channels * 2,
+        }
+        tmp_path = temp_path(meta_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, meta_path)
+        return info
+
+    def load(self, path):
+        """Returns a Sound of the processed sample. Safe to call from worker threads."""
+        return pygame.mixer.Sound(self.process(path)["path"])
+
+    def report(self, paths, deferred_paths=()):
+        """
+        Summarizes the memory the policy saves for a set of samples.
+
+        Args:
+            paths (iterable): Original sample paths the song uses.
+            deferred_paths (iterable): Samples kept out of memory until needed.
+        """
+        infos = [self.info[p] for p in set(paths) if p in self.info]
+        deferred = [self.info[p] for p in set(deferred_paths) if p in self.info]
+        original = sum(i["original_bytes"] for i in infos)
+        trimmed = original - sum(i["resident_bytes"] for i in infos)
+        deferred_bytes = sum(i["resident_bytes"] for i in deferred)
+        resident = original - trimmed - deferred_bytes
+        mb = 1024 * 1024
+        return (
+            f"Sample storage: {len(infos)} samples take {resident / mb:.1f} MB instead of "
+            f"{original / mb:.1f} MB (tails trimmed: {trimmed / mb:.1f} MB, "
+            f"{len(deferred)} rarely used samples deferred: {deferred_bytes / mb:.1f} MB; "
+            f"{sum(i['mono'] for i in infos)} stored as mono)."
+        )
+
+
+class DeferredSamples:
+    """
+    Keeps rarely used long samples (a final crash, a one-off effect) out of
+    memory until shortly before they play. They are loaded from the sample
+    cache on a worker thread PREFETCH_MS ahead of each use and dropped again
+    once no use is near.
+
+    Deferral is decided per sample file, since charts often map several WAV
+    IDs to one file: uses are counted across all of them, and every ID of a
+    deferred file is kept out of memory. For a song set the decision covers
+    every difficulty, so switching charts never has to load a deferred file
+    on the spot.
+    """
+
+    MAX_USES = 2  # Samples used at most this often per chart may be deferred...
+    MIN_LENGTH_S = 1.0  # ...if they are at least this long after trimming
+    PREFETCH_MS = 2000
+
+    def __init__(self, store, sounds, sound_cache, charts):
+        """
+        Args:
+            store (SampleStore): Provides the processed samples.
+            sounds (dict): The player's WAV ID -> Sound map; deferred samples
+                are added to and removed from it.
+            sound_cache (dict): The player's path -> Sound cache; deferred
+                samples are kept out of it so their memory is really freed.
+            charts (list[Dtx]): Every chart that may be played (one, or the
+                difficulties of a song set).
+        """
+        self.store = store
+        self.sounds = sounds
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.dtx = None
+        self.uses = {}  # Maps deferred path to its sorted use times in the current chart
+        self.wav_ids = {}  # Maps deferred path to the current chart's WAV IDs for it
+        self.loaded = {}  # Maps deferred path to its Sound while a use is near
+        self.pending = {}  # Maps deferred path to its load Future
+
+        # A file is deferred only if it is rarely used in every chart
+        self.paths = {
+            path
+            for chart in charts
+            for wav_id, path in chart.wav_files.items()
+            if wav_id != chart.bgm_wav_id
+            and path in store.info
+            and store.info[path]["length_s"] >= self.MIN_LENGTH_S
+        }
+        for chart in charts:
+            uses = self._uses(chart)
+            self.paths = {p for p in self.paths if len(uses.get(p, ())) <= self.MAX_USES}
+        for path in self.paths:
+            sound_cache.pop(path, None)
+
+    @staticmethod
+    def _uses(dtx_data):
+        """Maps each sample file to the sorted times it is played at."""
+        uses = {}
+        for time_ms, _, wav_id in dtx_data.timed_notes:
+            path = dtx_data.wav_files.get(wav_id)
+            if path:
+                uses.setdefault(path, []).append(time_ms)
+        return uses
+
+    def is_deferred(self, path):
+        """True if the sample file is only loaded shortly before its uses."""
+        return path in self.paths
+
+    def set_chart(self, dtx_data):
+        """Indexes a (new or reloaded) chart's uses of the deferred files."""
+        self.dtx = dtx_data
+        uses = self._uses(dtx_data)
+        self.uses = {path: uses.get(path, []) for path in self.paths}
+        self.wav_ids = {path: [] for path in self.paths}
+        for wav_id, path in dtx_data.wav_files.items():
+            if path in self.paths:
+                self.wav_ids[path].append(wav_id)
+                self.sounds.pop(wav_id, None)
+        self._publish()
+
+    def deferred_paths(self):
+        """The deferred files the current chart refers to."""
+        return [path for path, wav_ids in self.wav_ids.items() if wav_ids]
+
+    def _needed(self, path, current_time_ms):
+        """True while a use of the sample lies within the prefetch window."""
+        times = self.uses[path]
+        i = bisect.bisect_left(times, current_time_ms - self.PREFETCH_MS)
+        return i < len(times) and times[i] <= current_time_ms + self.PREFETCH_MS
+
+    def _publish(self):
+        """Points every WAV ID of a deferred file at its Sound while it is loaded."""
+        for path, wav_ids in self.wav_ids.items():
+            sound = self.loaded.get(path)
+            for wav_id in wav_ids:
+                if sound is None:
+                    self.sounds.pop(wav_id, None)
+                else:
+                    self.sounds[wav_id] = sound
+
+    def update(self, current_time_ms):
+        """Called regularly: loads samples that are about to play, drops the others."""
+        for path, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[path]
+                if future.exception() is None:
+                    self.loaded[path] = future.result()
+
+        for path in self.paths:
+            if self._needed(path, current_time_ms):
+                if path not in self.loaded and path not in self.pending:
+                    self.pending[path] = self.pool.submit(self.store.load, path)
+            else:
+                self.loaded.pop(path, None)
+        self._publish()
+
+    def load_now(self, wav_id):
+        """Loads a deferred sample right away, e.g. when a seek lands on its use."""
+        path = self.dtx.wav_files.get(wav_id) if self.dtx else None
+        if path in self.paths and path not in self.loaded:
+            try:
+                self.loaded[path] = self.store.load(path)
+            except pygame.error as e:
+                print(f"Warning: Could not load deferred sample {wav_id}. Error: {e}")
+                return
+            self._publish()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,392 @@
+import os
+import sys
+import hashlib
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pygame
+
+from cache_files import CACHE_ROOT, write_wav_atomic
+from dtx_parser import Dtx, read_command_lines
+from dtx_player import Player, LoadingScreen, run_startup_pipeline
+from audio_tuning import DEFAULT_LATENCY_MODE, LATENCY_MODES
+
+
+# File names probed when a chart does not declare #PREVIEW / #PREIMAGE.
+PREVIEW_FALLBACKS = ["preview.ogg", "pre.ogg", "preview.wav", "pre.wav"]
+BANNER_FALLBACKS = ["banner.png", "pre.png", "banner.jpg", "pre.jpg"]
+
+# Previews decoded to the mixer format, see PreviewService.
+PREVIEW_CACHE_DIR = os.path.join(CACHE_ROOT, "previews")
+
+
+def find_songs(library_dir):
+    """
+    Collects every song folder below `library_dir`: folders with a set.def
+    or at least one .dtx file. Only directory listings are read here, so
+    scanning stays fast for large libraries; chart headers are read later by
+    the preview workers.
+
+    Returns:
+        list[dict]: Entries with 'title', 'directory' and 'chart_path'
+        (the set.def if present, otherwise the first .dtx).
+    """
+    songs = []
+    for root, dirs, files in os.walk(library_dir):
+        dirs.sort()
+        charts = sorted(f for f in files if f.lower().endswith(".dtx"))
+        set_defs = [f for f in files if f.lower() == "set.def"]
+        if not charts and not set_defs:
+            continue
+        songs.append(
+            {
+                "title": os.path.basename(root),
+                "directory": root,
+                "chart_path": os.path.join(root, (set_defs or charts)[0]),
+            }
+        )
+    return songs
+
+
+def find_preview_resources(directory):
+    """
+    Resolves the preview audio and banner image of a song folder from the
+    first chart's #PREVIEW / #PREIMAGE, falling back to common file names.
+
+    Returns:
+        tuple[str | None, str | None]: (preview_path, banner_path).
+    """
+    preview_path = None
+    banner_path = None
+    names = sorted(os.listdir(directory))
+    lower_names = {name.lower(): name for name in names}
+
+    charts = [name for name in names if name.lower().endswith(".dtx")]
+    if charts:
+        content, _, _ = read_command_lines(os.path.join(directory, charts[0]))
+        for line in content or []:
+            line = line.strip()
+            if not line.startswith("#"):
+                continue
+            raw_key, raw_value = Dtx._split_line(line[1:])
+            key = raw_key.strip().upper()
+            value = raw_value.strip().split(";")[0].strip().replace("\\", "/")
+            if key == "PREVIEW" and value:
+                preview_path = os.path.join(directory, value)
+            elif key == "PREIMAGE" and value:
+                banner_path = os.path.join(directory, value)
+            # Header commands come first; stop at the first chip data line.
+            elif key[:3].isdigit():
+                break
+
+    if not (preview_path and os.path.exists(preview_path)):
+        preview_path = next(
+            (os.path.join(directory, lower_names[n]) for n in PREVIEW_FALLBACKS if n in lower_names),
+            None,
+        )
+    if not (banner_path and os.path.exists(banner_path)):
+        banner_path = next(
+            (os.path.join(directory, lower_names[n]) for n in BANNER_FALLBACKS if n in lower_names),
+            None,
+        )
+    return preview_path, banner_path
+
+
+def _init_preview_decoder(mixer_format):
+    """Preview decoder process: opens a silent mixer in the player's format."""
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    frequency, size, channels = mixer_format
+    pygame.mixer.init(frequency, size, channels)
+
+
+def _decode_preview(preview_path, wav_path):
+    """Preview decoder process: decodes a preview and writes it as a WAV file."""
+    sound = pygame.mixer.Sound(preview_path)
+    frequency, _, channels = pygame.mixer.get_init()
+    # The player's mixer format is always 16-bit (see Player.init_audio)
+    write_wav_atomic(wav_path, sound.get_raw(), frequency, channels)
+
+
+class PreviewService:
+    """
+    Decodes song previews (audio + banner) on background workers and keeps
+    the ones near the current selection in an LRU cache.
+
+    Decoding happens off the render thread: pygame releases the GIL while
+    SDL decodes images and while banners are scaled. Compressed audio is
+    another matter: SDL_mixer holds the audio lock while it decodes, which
+    stalls every mixer call on the main thread for tens of milliseconds.
+    Preview audio is therefore decoded once in a helper process and cached
+    as a WAV file in the mixer format (PREVIEW_CACHE_DIR); the workers only
+    ever load those, which does not touch the lock. Only the cheap parts
+    stay on the main thread in update(): converting banners to the display
+    pixel format and starting playback. Work for entries that have
+    scrolled out of the prefetch window is cancelled, and results that
+    arrive for them anyway are dropped.
+    """
+
+    PREFETCH_RADIUS = 3  # Entries above/below the selection to decode ahead
+    CACHE_SIZE = 16  # Decoded previews kept around (LRU)
+    CROSSFADE_MS = 500  # Crossfade time between two previews
+    PREVIEW_VOLUME = 0.8
+
+    def __init__(self, songs, banner_size, workers=2):
+        """
+        Args:
+            songs (list[dict]): Entries from find_songs().
+            banner_size (tuple[int, int]): Size banners are scaled to.
+            workers (int): Background decode threads.
+        """
+        self.songs = songs
+        self.banner_size = banner_size
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # Started on first use; spawned so it shares no SDL state with this process
+        self.decoder = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_preview_decoder,
+            initargs=(pygame.mixer.get_init(),),
+        )
+        self.cache = OrderedDict()  # Maps song index to (Sound | None, Surface | None)
+        self.pending = {}  # Maps song index to its decode Future
+        self.selected = None
+
+        # Two reserved mixer channels to crossfade between.
+        pygame.mixer.set_reserved(2)
+        self.channels = [pygame.mixer.Channel(0), pygame.mixer.Channel(1)]
+        self.active_channel = 0
+        self.playing = None  # Index of the song whose preview is audible
+
+    def _cached_preview(self, preview_path):
+        """
+        Worker: returns the path of a preview's WAV in the preview cache,
+        having the decoder process write it first if needed.
+        """
+        stat = os.stat(preview_path)
+        key = hashlib.sha1(
+            f"{pygame.mixer.get_init()} {os.path.abspath(preview_path)}"
+            f"|{stat.st_size}|{stat.st_mtime_ns}".encode()
+        ).hexdigest()
+        wav_path = os.path.join(PREVIEW_CACHE_DIR, key + ".wav")
+        if not os.path.exists(wav_path):
+            self.decoder.submit(_decode_preview, preview_path, wav_path).result()
+        return wav_path
+
+    def _decode(self, directory, banner_size):
+        """Worker: resolves and decodes one song's preview files."""
+        preview_path, banner_path = find_preview_resources(directory)
+        sound = None
+        banner = None
+        if preview_path:
+            try:
+                sound = pygame.mixer.Sound(self._cached_preview(preview_path))
+            except Exception as e:
+                print(f"Warning: Could not load preview '{preview_path}'. Error: {e}")
+        if banner_path:
+            try:
+                banner = pygame.transform.smoothscale(
+                    pygame.image.load(banner_path), banner_size
+                )
+            except pygame.error as e:
+                print(f"Warning: Could not load banner '{banner_path}'. Error: {e}")
+        return sound, banner
+
+    def select(self, index):
+        """
+        Moves the selection: queues decoding for the selected entry and its
+        neighbours (nearest first) and cancels work that is no longer needed.
+        """
+        self.selected = index
+        window = {
+            i
+            for i in range(index - self.PREFETCH_RADIUS, index + self.PREFETCH_RADIUS + 1)
+            if 0 <= i < len(self.songs)
+        }
+
+        for i in list(self.pending):
+            if i not in window and self.pending[i].cancel():
+                del self.pending[i]
+
+        for i in sorted(window, key=lambda i: abs(i - index)):
+            if i in self.cache:
+                self.cache.move_to_end(i)
+            elif i not in self.pending:
+                self.pending[i] = self.pool.submit(
+                    self._decode, self.songs[i]["directory"], self.banner_size
+                )
+
+    def banner(self, index):
+        """Returns the converted banner for a song, or None if not ready."""
+        entry = self.cache.get(index)
+        return entry[1] if entry else None
+
+    def update(self):
+        """
+        Called once per frame: collects finished decodes and crossfades to
+        the selected song's preview once it is available.
+        """
+        for i, future in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[i]
+            if future.cancelled():
+                continue
+            sound, banner = future.result()
+            if abs(i - self.selected) > self.PREFETCH_RADIUS:
+                continue  # Scrolled away while decoding
+            if banner is not None:
+                banner = banner.convert_alpha() if banner.get_alpha() else banner.convert()
+            self.cache[i] = (sound, banner)
+            while len(self.cache) > self.CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+        if self.playing != self.selected and self.selected in self.cache:
+            self._crossfade_to(self.selected)
+
+    def _crossfade_to(self, index):
+        """Fades out the current preview and fades in the one for `index`."""
+        self.channels[self.active_channel].fadeout(self.CROSSFADE_MS)
+        self.playing = index
+        sound = self.cache[index][0]
+        if sound is None:
+            return
+        self.active_channel = 1 - self.active_channel
+        channel = self.channels[self.active_channel]
+        channel.set_volume(self.PREVIEW_VOLUME)
+        channel.play(sound, loops=-1, fade_ms=self.CROSSFADE_MS)
+
+    def shutdown(self):
+        """Stops playback and discards queued work."""
+        for channel in self.channels:
+            channel.stop()
+        pygame.mixer.set_reserved(0)  # Give the channels back to the player
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+
+
+class SongSelect:
+    """A minimal song select screen with asynchronous previews."""
+
+    SCREEN_WIDTH = Player.SCREEN_WIDTH
+    SCREEN_HEIGHT = Player.SCREEN_HEIGHT
+    ROW_HEIGHT = 32
+    VISIBLE_ROWS = 15
+    BANNER_SIZE = (320, 240)
+
+    COLOR_BACKGROUND = Player.COLOR_BACKGROUND
+    COLOR_TEXT = Player.COLOR_TEXT
+    COLOR_SELECTED = (180, 180, 40)
+
+    def __init__(self, songs, latency_mode=None):
+        """
+        Args:
+            songs (list[dict]): Entries from find_songs().
+            latency_mode (str, optional): See Player.init_audio.
+        """
+        self.songs = songs
+        self.index = 0
+
+        # Opened like the player's startup pipeline does, so a first-launch
+        # probe of the audio device keeps the window responsive
+        loading = LoadingScreen()
+        loading.open_audio(latency_mode)
+        self.screen = loading.screen
+        pygame.display.set_caption("Song Select")
+        self.font = pygame.font.Font(None, 28)
+        self.title_surfaces = {}  # Rendered titles, so scrolling doesn't re-render text
+        self.previews = PreviewService(songs, self.BANNER_SIZE)
+
+    def _title_surface(self, index, selected):
+        key = (index, selected)
+        if key not in self.title_surfaces:
+            color = self.COLOR_SELECTED if selected else self.COLOR_TEXT
+            self.title_surfaces[key] = self.font.render(self.songs[index]["title"], True, color)
+        return self.title_surfaces[key]
+
+    def _draw(self):
+        self.screen.fill(self.COLOR_BACKGROUND)
+
+        first_row = max(0, self.index - self.VISIBLE_ROWS // 2)
+        for row, i in enumerate(range(first_row, min(first_row + self.VISIBLE_ROWS, len(self.songs)))):
+            surface = self._title_surface(i, i == self.index)
+            self.screen.blit(surface, (20, 40 + row * self.ROW_HEIGHT))
+
+        banner = self.previews.banner(self.index)
+        banner_rect = pygame.Rect((0, 0), self.BANNER_SIZE)
+        banner_rect.topright = (self.SCREEN_WIDTH - 20, 40)
+        if banner is not None:
+            self.screen.blit(banner, banner_rect)
+        else:
+            pygame.draw.rect(self.screen, Player.COLOR_LANE_SEPARATOR, banner_rect, 1)
+
+        pygame.display.flip()
+
+    def run(self):
+        """
+        Runs the selection loop.
+
+        Returns:
+            str | None: The chart path chosen with Enter, or None on quit.
+        """
+        clock = pygame.time.Clock()
+        self.previews.select(self.index)
+        chosen = None
+
+        running = True
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (
+                    event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE
+                ):
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    step = {pygame.K_UP: -1, pygame.K_DOWN: 1, pygame.K_PAGEUP: -10, pygame.K_PAGEDOWN: 10}
+                    if event.key in step:
+                        self.index = min(max(self.index + step[event.key], 0), len(self.songs) - 1)
+                        self.previews.select(self.index)
+                    elif event.key == pygame.K_RETURN:
+                        chosen = self.songs[self.index]["chart_path"]
+                        running = False
+
+            self.previews.update()
+            self._draw()
+            clock.tick(60)
+
+        self.previews.shutdown()
+        return chosen
+
+
+def main():
+    """Browse a song library with previews, then play the chosen song."""
+    parser = argparse.ArgumentParser(description="Browse and play a DTX song library.")
+    parser.add_argument("library", help="directory containing song folders")
+    parser.add_argument(
+        "--latency",
+        choices=LATENCY_MODES,
+        default=DEFAULT_LATENCY_MODE,
+        help="audio buffer size, see dtx_player.py --help (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    songs = find_songs(args.library)
+    if not songs:
+        print(f"No songs found in '{args.library}'.")
+        sys.exit(1)
+    print(f"Found {len(songs)} songs.")
+
+    chart_path = SongSelect(songs, args.latency).run()
+    if chart_path is None:
+        pygame.quit()
+        return
+
+    # The same startup path as the player's: loading screen, parallel decoding
+    player = run_startup_pipeline(chart_path, latency_mode=args.latency)
+    if player is None:
+        sys.exit(1)
+    player.play()
+
+
+if __name__ == "__main__":
+    main()